@@ -10,19 +10,49 @@ class Settings(BaseSettings):
     
     # LLM Configuration
     openai_api_key: Optional[str] = None
+    # Same variable as the OpenAI SDK; point at a proxy or compatible gateway
+    openai_base_url: str = "https://api.openai.com/v1"
     anthropic_api_key: Optional[str] = None
     llm_provider: str = "openai"
     
+    # Provider HTTP connection pool (shared by the OpenAI/Anthropic clients)
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 50
+    http_timeout: float = 60.0
+    
     # Vector Database
     vector_db_type: str = "pinecone"
     pinecone_api_key: Optional[str] = None
     pinecone_environment: str = "us-east-1"
     pinecone_index_name: str = "rag-qa-index"
+    pinecone_max_concurrency: int = 4
+    pinecone_connection_pool_size: int = 32  # Kept-alive connections; cover concurrent queries
+    vector_upsert_batch_size: int = 100
+    # In-process HNSW index (vector_db_type = "hnsw")
+    hnsw_max_elements: int = 100_000  # Initial capacity; grows as needed
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 64
+    hnsw_ef_search: int = 40  # Higher trades query speed for recall
+    hnsw_index_path: Optional[str] = "data/hnsw_index"  # Saved after writes, loaded on start; empty disables
+    hnsw_save_interval_s: float = 30.0  # Writes are saved together at most this often
+    # In-process IVF index with an HNSW quantizer (vector_db_type = "ivf_hnsw")
+    ivf_nlist: int = 1024  # k-means cells
+    ivf_nprobe: int = 32  # Cells scanned per query; higher trades speed for recall
+    ivf_train_size: int = 100_000  # Vectors searched exactly until the cells are trained
+    ivf_hnsw_m: int = 12
+    ivf_hnsw_ef_construction: int = 15
+    ivf_storage: str = "float32"  # "float32", "float16" or "int8" per stored vector
     
     # Embeddings
     embedding_model: str = "text-embedding-ada-002"
     embedding_dimension: int = 1536
     embedding_provider: str = "openai"
+    embedding_max_batch_size: int = 96
+    embedding_max_latency_ms: float = 10.0
+    embedding_max_concurrency: int = 8  # Provider calls in flight from the batch worker
+    embedding_cache_path: Optional[str] = "data/embedding_cache.sqlite3"  # Empty disables the cache
+    embedding_cache_dtype: str = "float16"  # "float16" or "float32"
+    embedding_cache_max_entries: int = 200_000  # Least recently used beyond this are deleted; 0 keeps all
     
     # RAG Configuration
     chunk_size: int = 1000
@@ -31,6 +61,19 @@ class Settings(BaseSettings):
     confidence_threshold: float = 0.7
     max_retries: int = 3
     temperature: float = 0.0
+    llm_cache_size: int = 1024  # 0 disables the semantic response cache
+    llm_cache_similarity_threshold: float = 0.95
+    query_cache_size: int = 1024  # 0 disables the query answer cache
+    query_cache_similarity_threshold: float = 0.95
+    query_cache_ttl_s: float = 300.0  # Bounds staleness from other replicas' writes; 0 disables
+    llm_batch_size: int = 8  # Queries packed into one completion by /query/batch
+    query_batch_max_size: int = 50
+    
+    # Ingestion
+    pdf_extraction_workers: Optional[int] = None  # Defaults to os.cpu_count()
+    document_metadata_cache_size: int = 10_000
+    ingestion_concurrency: int = 5
+    ingestion_max_pending: int = 50  # Queued plus processing uploads; more are refused with 503
     
     # GCP Configuration
     gcp_project_id: Optional[str] = None
@@ -1,13 +1,16 @@
 """
 FastAPI application for RAG System.
 """
-import os
+import asyncio
 import tempfile
+from contextlib import asynccontextmanager
+import orjson
 from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, TypeAdapter
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 from app.config import settings
 from app.models.schemas import (
@@ -18,19 +21,49 @@ from app.models.schemas import (
     HealthResponse,
     Citation
 )
-from app.services.document_service import DocumentService
-from app.services.retrieval_service import RetrievalService
+from app.services.document_service import (
+    DocumentService,
+    IngestionQueueFull,
+    get_document_service
+)
+from app.services.retrieval_service import RetrievalService, get_retrieval_service
+from app.services.vector_db_service import get_vector_db_service
+from app.utils.http import get_async_http_client
 from app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+# Built once so citation schema compilation is not repeated per request
+CITATIONS_ADAPTER = TypeAdapter(List[Citation])
+QUERY_RESPONSES_ADAPTER = TypeAdapter(List[QueryResponse])
+
+# Upload bytes are copied in pieces of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Uploads up to this size stay in memory; larger ones spill to disk
+UPLOAD_SPOOL_MAX_SIZE = 16 * 1024 * 1024
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    On shutdown, save in-process index writes still waiting for their
+    interval and close the provider HTTP connection pool.
+    """
+    yield
+    await asyncio.to_thread(get_vector_db_service().persist)
+    await get_async_http_client().aclose()
+    get_async_http_client.cache_clear()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="RAG System for Grounded Document QA",
     description="Production-ready RAG system with confidence scoring and citation generation",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -42,9 +75,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-document_service = DocumentService()
-retrieval_service = RetrievalService()
+# Initialize services up front so misconfiguration fails at startup;
+# routes receive the same instances through Depends
+get_document_service()
+get_retrieval_service()
+
+
+def _model_response(model: BaseModel, status_code: int = 200) -> Response:
+    """
+    Serialize a response model with Pydantic's compiled serializer.
+
+    Returning a Response directly skips FastAPI's response_model
+    re-validation and jsonable_encoder pass; response_model is still
+    declared on each route for the OpenAPI schema.
+    """
+    return Response(
+        content=model.model_dump_json(),
+        status_code=status_code,
+        media_type="application/json"
+    )
 
 
 @app.get("/health", response_model=HealthResponse)
@@ -58,68 +107,87 @@ async def health_check():
             "llm_service": "healthy"
         }
         
-        return HealthResponse(
+        return _model_response(HealthResponse.model_construct(
             status="healthy",
             version="1.0.0",
             services=services
-        )
+        ))
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
         raise HTTPException(status_code=503, detail="Service unhealthy")
 
 
-@app.post("/api/v1/documents/ingest", response_model=DocumentIngestResponse)
-async def ingest_document(file: UploadFile = File(...)):
+@app.post("/api/v1/documents/ingest", response_model=DocumentIngestResponse, status_code=202)
+async def ingest_document(
+    file: UploadFile = File(...),
+    document_service: DocumentService = Depends(get_document_service)
+):
     """
-    Ingest a document for RAG processing.
+    Queue a document for RAG processing.
     
-    Supports: PDF, TXT, DOCX, MD
+    Returns 202 Accepted immediately; poll /api/v1/documents/{document_id}
+    for progress. Returns 503 while ingestion_max_pending uploads are
+    already queued or processing. Supports: PDF, TXT, DOCX, MD
     """
     try:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
-            tmp_path = tmp_file.name
-        
+        # Keep the upload as a stream for the extractors; only large files
+        # touch disk, and writes that may spill run off the event loop
+        upload = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_SIZE)
         try:
-            # Ingest document
-            result = document_service.ingest_document(
-                file_path=tmp_path,
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await asyncio.to_thread(upload.write, chunk)
+            
+            # Hand the stream over to background ingestion
+            result = document_service.submit_document(
+                stream=upload,
                 filename=file.filename,
                 metadata={"uploaded_at": datetime.utcnow().isoformat()}
             )
-            
-            return DocumentIngestResponse(
-                document_id=result["document_id"],
-                status=result["status"],
-                chunks_created=result["chunks_created"],
-                message=result["message"]
-            )
-        finally:
-            # Clean up temp file
-            os.unlink(tmp_path)
-            
+        except Exception:
+            # The job never took ownership of the stream
+            upload.close()
+            raise
+        
+        # Fields come from DocumentService, never from user input, so
+        # skip re-validating them on the way out
+        return _model_response(DocumentIngestResponse.model_construct(
+            document_id=result["document_id"],
+            status=result["status"],
+            chunks_created=result["chunks_created"],
+            message=result["message"]
+        ), status_code=202)
+        
     except ValueError as e:
         logger.error(f"Validation error: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
+    except IngestionQueueFull as e:
+        logger.warning(f"Rejecting upload: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail="Ingestion queue is full; retry later",
+            headers={"Retry-After": "5"}
+        )
     except Exception as e:
         logger.error(f"Error ingesting document: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to ingest document: {str(e)}")
 
 
 @app.get("/api/v1/documents/{document_id}", response_model=DocumentStatus)
-async def get_document_status(document_id: str):
+async def get_document_status(
+    document_id: str,
+    document_service: DocumentService = Depends(get_document_service)
+):
     """Get status of an ingested document."""
     try:
         status = document_service.get_document_status(document_id)
-        return DocumentStatus(
+        # Stored status is produced internally; no validation needed
+        return _model_response(DocumentStatus.model_construct(
             document_id=status["document_id"],
             status=status["status"],
             chunks_count=status["chunks_count"],
             created_at=datetime.utcnow(),  # In production, get from DB
             metadata=status.get("metadata")
-        )
+        ))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
@@ -128,50 +196,129 @@ async def get_document_status(document_id: str):
 
 
 @app.post("/api/v1/query", response_model=QueryResponse)
-async def query_documents(request: QueryRequest):
+async def query_documents(
+    request: QueryRequest,
+    retrieval_service: RetrievalService = Depends(get_retrieval_service)
+):
     """
     Query documents using RAG with confidence scoring.
     
     Returns answer with citations and confidence metrics.
     """
     try:
-        result = retrieval_service.retrieve_and_answer(
+        result = await retrieval_service.retrieve_and_answer(
             query=request.query,
             top_k=request.top_k,
             confidence_threshold=request.confidence_threshold,
             include_citations=request.include_citations
         )
         
-        # Convert citations to Citation models
-        citations = [
-            Citation(
-                document_id=cit.get("document_id", ""),
-                chunk_id=cit.get("chunk_id", ""),
-                text=cit.get("text", ""),
-                confidence_score=cit.get("confidence_score", 0.0),
-                metadata=cit.get("metadata")
-            )
-            for cit in result.get("citations", [])
-        ]
+        # Convert citations to Citation models in a single adapter call.
+        # The response itself originates from RetrievalService (and the
+        # already-validated request), so it is built without re-validation.
+        citations = CITATIONS_ADAPTER.validate_python(result.get("citations", []))
         
-        return QueryResponse(
+        return _model_response(QueryResponse.model_construct(
             answer=result["answer"],
             citations=citations,
             confidence_score=result["confidence_score"],
             retrieval_metadata=result.get("retrieval_metadata", {}),
             query=request.query
+        ))
+        
+    except Exception as e:
+        logger.error(f"Error processing query: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to process query: {str(e)}")
+
+
+@app.post("/api/v1/query/batch", response_model=List[QueryResponse])
+async def query_documents_batch(
+    requests: List[QueryRequest],
+    retrieval_service: RetrievalService = Depends(get_retrieval_service)
+):
+    """
+    Answer several queries in one request.
+    
+    Queries are embedded together and their answers generated with shared
+    LLM calls. Responses are returned in request order.
+    """
+    if len(requests) > settings.query_batch_max_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.query_batch_max_size} queries per batch"
+        )
+    
+    try:
+        results = []
+        if requests:
+            results = await retrieval_service.retrieve_and_answer_batch(
+                [request.model_dump() for request in requests]
+            )
+        
+        responses = [
+            QueryResponse.model_construct(
+                answer=result["answer"],
+                citations=CITATIONS_ADAPTER.validate_python(result.get("citations", [])),
+                confidence_score=result["confidence_score"],
+                retrieval_metadata=result.get("retrieval_metadata", {}),
+                query=request.query
+            )
+            for request, result in zip(requests, results)
+        ]
+        
+        return Response(
+            content=QUERY_RESPONSES_ADAPTER.dump_json(responses),
+            media_type="application/json"
         )
         
+    except Exception as e:
+        logger.error(f"Error processing query batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to process query batch: {str(e)}")
+
+
+@app.post("/api/v1/query/stream")
+async def stream_query(
+    request: QueryRequest,
+    retrieval_service: RetrievalService = Depends(get_retrieval_service)
+):
+    """
+    Query documents and stream the answer as Server-Sent Events.
+    
+    Each event is a ``data:`` line holding JSON: ``token`` events carry
+    answer text as it is generated, and a final ``done`` event carries
+    citations and confidence metrics.
+    """
+    try:
+        # Retrieve before streaming starts so failures still map to HTTP errors
+        retrieval = await retrieval_service.retrieve_context(
+            query=request.query,
+            top_k=request.top_k,
+            confidence_threshold=request.confidence_threshold
+        )
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to process query: {str(e)}")
+    
+    async def event_stream():
+        try:
+            async for event in retrieval_service.stream_answer(
+                query=request.query,
+                retrieval=retrieval,
+                include_citations=request.include_citations
+            ):
+                yield b"data: " + orjson.dumps(event) + b"\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming answer: {str(e)}")
+            yield b"data: " + orjson.dumps({"type": "error", "detail": str(e)}) + b"\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
 
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """Global exception handler."""
     logger.error(f"Unhandled exception: {str(exc)}")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"detail": "Internal server error"}
     )
@@ -1,16 +1,21 @@
 """
 Document chunking pipeline for optimal retrieval.
 """
-from typing import List, Dict, Any
+import re
+from typing import List, Dict, Any, Tuple
+import numpy as np
 from app.config import settings
 from app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+# Simple sentence splitting (can be enhanced with NLTK)
+_SENT_RE = re.compile(r'(?<=[.!?])\s+')
+
 
 class DocumentChunker:
     """Intelligent document chunking with overlap."""
-    
+
     def __init__(
         self,
         chunk_size: int = None,
@@ -18,7 +23,7 @@ class DocumentChunker:
     ):
         self.chunk_size = chunk_size or settings.chunk_size
         self.chunk_overlap = chunk_overlap or settings.chunk_overlap
-        
+
     def chunk_text(
         self,
         text: str,
@@ -26,88 +31,93 @@ class DocumentChunker:
     ) -> List[Dict[str, Any]]:
         """
         Split text into chunks with overlap.
-        
+
+        Chunk boundaries are found on arrays of sentence offsets and each
+        chunk is a single slice of the original text, so no intermediate
+        sentence or chunk strings are built.
+
         Args:
             text: Input text to chunk
             metadata: Additional metadata for chunks
-            
+
         Returns:
             List of chunk dictionaries with text and metadata
         """
         if not text or not text.strip():
             logger.warning("Empty text provided for chunking")
             return []
-        
-        chunks = []
-        start = 0
-        chunk_id = 0
-        
+
+        metadata = metadata or {}
+        document_id = metadata.get('document_id', 'doc')
+
         # Split by sentences first for better semantic boundaries
-        sentences = self._split_sentences(text)
-        
-        current_chunk = []
-        current_length = 0
-        
-        for sentence in sentences:
-            sentence_length = len(sentence)
-            
-            # If adding this sentence would exceed chunk size
-            if current_length + sentence_length > self.chunk_size and current_chunk:
-                # Save current chunk
-                chunk_text = " ".join(current_chunk)
-                chunks.append({
-                    "chunk_id": f"{metadata.get('document_id', 'doc')}_{chunk_id}",
-                    "text": chunk_text,
-                    "start_index": start,
-                    "end_index": start + len(chunk_text),
-                    "metadata": {
-                        **(metadata or {}),
-                        "chunk_index": chunk_id
-                    }
-                })
-                chunk_id += 1
-                
-                # Start new chunk with overlap
-                overlap_text = self._get_overlap_text(chunk_text)
-                current_chunk = [overlap_text] if overlap_text else []
-                current_length = len(overlap_text) if overlap_text else 0
-                start += len(chunk_text) - len(overlap_text)
-            
-            current_chunk.append(sentence)
-            current_length += sentence_length + 1  # +1 for space
-        
-        # Add final chunk
-        if current_chunk:
-            chunk_text = " ".join(current_chunk)
+        starts, ends = self._split_sentences(text)
+
+        chunks = []
+        sentence_count = len(starts)
+        next_sentence = 0
+        chunk_start = int(starts[0])
+
+        while next_sentence < sentence_count:
+            # Last sentence that still ends within the chunk budget, taking at
+            # least one sentence so oversized sentences still make progress
+            last = int(np.searchsorted(ends, chunk_start + self.chunk_size, side="right")) - 1
+            last = max(last, next_sentence)
+            chunk_end = int(ends[last])
+
+            chunk_index = len(chunks)
             chunks.append({
-                "chunk_id": f"{metadata.get('document_id', 'doc')}_{chunk_id}",
-                "text": chunk_text,
-                "start_index": start,
-                "end_index": start + len(chunk_text),
+                "chunk_id": f"{document_id}_{chunk_index}",
+                "text": text[chunk_start:chunk_end],
+                "start_index": chunk_start,
+                "end_index": chunk_end,
                 "metadata": {
-                    **(metadata or {}),
-                    "chunk_index": chunk_id
+                    **metadata,
+                    "chunk_index": chunk_index
                 }
             })
-        
+
+            next_sentence = last + 1
+            if next_sentence < sentence_count:
+                # Start new chunk with overlap
+                chunk_start = self._get_overlap_start(text, chunk_start, chunk_end)
+
         logger.info(f"Created {len(chunks)} chunks from text of length {len(text)}")
         return chunks
-    
-    def _split_sentences(self, text: str) -> List[str]:
-        """Split text into sentences."""
-        import re
-        # Simple sentence splitting (can be enhanced with NLTK)
-        sentences = re.split(r'(?<=[.!?])\s+', text)
-        return [s.strip() for s in sentences if s.strip()]
-    
-    def _get_overlap_text(self, text: str) -> str:
-        """Get overlap text from the end of a chunk."""
-        if len(text) <= self.chunk_overlap:
-            return text
-        
-        # Get last chunk_overlap characters, but try to break at word boundary
-        overlap = text[-self.chunk_overlap:]
-        first_space = overlap.find(' ')
-        if first_space > 0:
-            return overlap[first_space + 1:]
-        return overlap
+
+    def _split_sentences(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Locate sentences in text without copying them.
+
+        A separator is the whitespace run after sentence punctuation, so
+        every sentence but the first and last already starts and ends on
+        non-whitespace; only the outer edges of the text need trimming.
+
+        Returns:
+            Tuple of (start offsets, end offsets) of the stripped sentences
+        """
+        spans = np.fromiter(
+            (offset for m in _SENT_RE.finditer(text) for offset in m.span()),
+            dtype=np.int64
+        ).reshape(-1, 2)
+        first = len(text) - len(text.lstrip())
+        last = len(text.rstrip())
+
+        starts = np.concatenate(([first], spans[:, 1]))
+        ends = np.concatenate((spans[:, 0], [last]))
+        # Trailing whitespace after the final separator leaves an empty tail
+        if starts[-1] >= ends[-1]:
+            starts, ends = starts[:-1], ends[:-1]
+        return starts, ends
+
+    def _get_overlap_start(self, text: str, chunk_start: int, chunk_end: int) -> int:
+        """Get the offset where the overlap with the previous chunk begins."""
+        if chunk_end - chunk_start <= self.chunk_overlap:
+            return chunk_start
+
+        # Take the last chunk_overlap characters, but try to break at word boundary
+        overlap_start = chunk_end - self.chunk_overlap
+        first_space = text.find(' ', overlap_start, chunk_end)
+        if first_space > overlap_start:
+            return first_space + 1
+        return overlap_start
@@ -1,14 +1,51 @@
 """
 Document ingestion pipeline for processing various file formats.
 """
+import io
+import multiprocessing
 import os
 import uuid
-from typing import Dict, Any, Optional
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, Any, BinaryIO, List, Optional, Union
 from pathlib import Path
+from app.config import settings
 from app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+# PDFs shorter than this are extracted in-process; re-parsing the document
+# in each worker costs more than it saves on small documents
+PDF_PARALLEL_MIN_PAGES = 16
+
+
+def _pdf_worker_count() -> int:
+    """Number of processes used for PDF extraction."""
+    return settings.pdf_extraction_workers or os.cpu_count() or 1
+
+
+@lru_cache(maxsize=1)
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """
+    Process pool shared by all PDF extractions.
+
+    The pool is created lazily from a worker thread while the event loop
+    and other threads are running. Forking then can copy locks held by
+    those threads into the child, so workers start from a forkserver
+    (spawn where that is unavailable) instead.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return ProcessPoolExecutor(max_workers=_pdf_worker_count(), mp_context=context)
+
+
+def _extract_pdf_pages(data: bytes, start: int, stop: int) -> List[str]:
+    """Extract text of pages [start, stop) in a worker process."""
+    from PyPDF2 import PdfReader
+    # Readers are not picklable, so each worker parses its own
+    reader = PdfReader(io.BytesIO(data))
+    return [reader.pages[i].extract_text() for i in range(start, stop)]
+
 
 class DocumentIngester:
     """Handle document ingestion from various formats."""
@@ -19,39 +56,52 @@ class DocumentIngester:
         self.upload_dir = Path(upload_dir)
         self.upload_dir.mkdir(exist_ok=True)
     
+    def validate_format(self, filename: str) -> str:
+        """Return the lowercased file extension, rejecting unsupported formats."""
+        file_ext = Path(filename).suffix.lower()
+        
+        if file_ext not in self.SUPPORTED_FORMATS:
+            raise ValueError(f"Unsupported file format: {file_ext}")
+        
+        return file_ext
+    
     def ingest_file(
         self,
-        file_path: str,
+        source: Union[str, BinaryIO],
         filename: str,
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[Dict[str, Any]] = None,
+        document_id: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Ingest a document file and extract text.
         
         Args:
-            file_path: Path to the file
+            source: Path to the file, or a seekable binary stream of its contents
             filename: Original filename
             metadata: Additional metadata
+            document_id: Pre-assigned document ID; generated if omitted
             
         Returns:
             Dictionary with document_id and extracted text
         """
-        file_ext = Path(filename).suffix.lower()
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as stream:
+                return self.ingest_file(stream, filename, metadata, document_id)
         
-        if file_ext not in self.SUPPORTED_FORMATS:
-            raise ValueError(f"Unsupported file format: {file_ext}")
+        file_ext = self.validate_format(filename)
         
-        document_id = str(uuid.uuid4())
+        document_id = document_id or str(uuid.uuid4())
         
         try:
+            source.seek(0)
             if file_ext == '.pdf':
-                text = self._extract_from_pdf(file_path)
+                text = self._extract_from_pdf(source)
             elif file_ext == '.txt':
-                text = self._extract_from_txt(file_path)
+                text = self._extract_from_txt(source)
             elif file_ext == '.docx':
-                text = self._extract_from_docx(file_path)
+                text = self._extract_from_docx(source)
             elif file_ext == '.md':
-                text = self._extract_from_md(file_path)
+                text = self._extract_from_md(source)
             else:
                 raise ValueError(f"Unsupported format: {file_ext}")
             
@@ -62,51 +112,66 @@ class DocumentIngester:
                 "file_type": file_ext,
                 "metadata": {
                     **(metadata or {}),
-                    "file_size": os.path.getsize(file_path)
+                    "file_size": source.seek(0, os.SEEK_END)
                 }
             }
         except Exception as e:
             logger.error(f"Error ingesting file {filename}: {str(e)}")
             raise
     
-    def _extract_from_pdf(self, file_path: str) -> str:
-        """Extract text from PDF file."""
+    def _extract_from_pdf(self, stream: BinaryIO) -> str:
+        """
+        Extract text from PDF file.
+
+        Page extraction is CPU-bound, so longer documents are split into
+        contiguous page ranges and extracted across a process pool.
+        """
         try:
             from PyPDF2 import PdfReader
-            reader = PdfReader(file_path)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text.strip()
+            reader = PdfReader(stream)
+            page_count = len(reader.pages)
+
+            if page_count < PDF_PARALLEL_MIN_PAGES:
+                pages = [page.extract_text() for page in reader.pages]
+            else:
+                stream.seek(0)
+                data = stream.read()
+                pool = _get_pdf_pool()
+                step = -(-page_count // _pdf_worker_count())
+                futures = [
+                    pool.submit(_extract_pdf_pages, data, start, min(start + step, page_count))
+                    for start in range(0, page_count, step)
+                ]
+                pages = [text for future in futures for text in future.result()]
+
+            return "\n".join(pages).strip()
         except Exception as e:
             logger.error(f"PDF extraction error: {str(e)}")
             raise
     
-    def _extract_from_txt(self, file_path: str) -> str:
+    def _extract_from_txt(self, stream: BinaryIO) -> str:
         """Extract text from TXT file."""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
+            return stream.read().decode('utf-8')
         except Exception as e:
             logger.error(f"TXT extraction error: {str(e)}")
             raise
     
-    def _extract_from_docx(self, file_path: str) -> str:
+    def _extract_from_docx(self, stream: BinaryIO) -> str:
         """Extract text from DOCX file."""
         try:
             from docx import Document
-            doc = Document(file_path)
+            doc = Document(stream)
             text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
             return text.strip()
         except Exception as e:
             logger.error(f"DOCX extraction error: {str(e)}")
             raise
     
-    def _extract_from_md(self, file_path: str) -> str:
+    def _extract_from_md(self, stream: BinaryIO) -> str:
         """Extract text from Markdown file."""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
+            return stream.read().decode('utf-8')
         except Exception as e:
             logger.error(f"Markdown extraction error: {str(e)}")
             raise
@@ -1,55 +1,168 @@
 """
 Document service for managing document ingestion and storage.
 """
+import asyncio
 import uuid
-from typing import Dict, Any, List
+from functools import lru_cache
+from typing import Dict, Any, BinaryIO, List, Optional, Set, Union
+from app.config import settings
 from app.pipelines.ingestion import DocumentIngester
 from app.pipelines.chunking import DocumentChunker
-from app.services.embedding_service import EmbeddingService
-from app.services.vector_db_service import VectorDBService
+from app.services.embedding_service import get_embedding_service
+from app.services.vector_db_service import get_vector_db_service
+from app.utils.cache import LRUCache
 from app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
 
+class IngestionQueueFull(RuntimeError):
+    """Raised when ingestion_max_pending documents are already queued or processing."""
+
+
 class DocumentService:
     """Service for document management."""
     
     def __init__(self):
         self.ingester = DocumentIngester()
         self.chunker = DocumentChunker()
-        self.embedding_service = EmbeddingService()
-        self.vector_db_service = VectorDBService()
-        self._documents = {}  # In-memory storage (use DB in production)
+        self.embedding_service = get_embedding_service()
+        self.vector_db_service = get_vector_db_service()
+        # Bounded in-memory storage (use DB in production)
+        self._documents = LRUCache(maxsize=settings.document_metadata_cache_size)
+        # Caps how many queued documents are processed at once
+        self._ingestion_slots = asyncio.Semaphore(settings.ingestion_concurrency)
+        # Each pending job holds its upload, so the queue itself is bounded too
+        self.max_pending = settings.ingestion_max_pending
+        self._ingestion_tasks: Set[asyncio.Task] = set()
     
-    def ingest_document(
+    def submit_document(
         self,
-        file_path: str,
+        stream: BinaryIO,
         filename: str,
         metadata: Dict[str, Any] = None
+    ) -> Dict[str, Any]:
+        """
+        Queue a document for background ingestion.
+        
+        The ingestion job takes ownership of stream and closes it once
+        processing finishes. Progress is reported through
+        get_document_status as queued -> processing -> processed | failed.
+        
+        Args:
+            stream: Seekable binary stream of the document contents
+            filename: Original filename
+            metadata: Additional metadata
+            
+        Returns:
+            Dictionary with document_id and queued status
+            
+        Raises:
+            ValueError: If the format is not supported
+            IngestionQueueFull: If max_pending jobs are already pending
+        """
+        # Reject unsupported formats up front rather than failing in the job
+        self.ingester.validate_format(filename)
+        if len(self._ingestion_tasks) >= self.max_pending:
+            raise IngestionQueueFull(
+                f"{len(self._ingestion_tasks)} documents are already pending ingestion"
+            )
+        
+        document_id = str(uuid.uuid4())
+        self._set_status(document_id, filename, "queued", metadata)
+        
+        task = asyncio.create_task(
+            self._run_ingestion(document_id, stream, filename, metadata)
+        )
+        # Hold a reference so the task is not garbage collected mid-flight
+        self._ingestion_tasks.add(task)
+        task.add_done_callback(self._ingestion_tasks.discard)
+        
+        logger.info(f"Queued document {document_id} for ingestion")
+        
+        return {
+            "document_id": document_id,
+            "status": "queued",
+            "chunks_created": 0,
+            "message": "Document queued for ingestion"
+        }
+    
+    async def _run_ingestion(
+        self,
+        document_id: str,
+        stream: BinaryIO,
+        filename: str,
+        metadata: Optional[Dict[str, Any]]
+    ):
+        """Background job: ingest a queued document and record the outcome."""
+        async with self._ingestion_slots:
+            self._set_status(document_id, filename, "processing", metadata)
+            try:
+                await self.ingest_document(
+                    source=stream,
+                    filename=filename,
+                    metadata=metadata,
+                    document_id=document_id
+                )
+            except Exception as e:
+                self._set_status(
+                    document_id,
+                    filename,
+                    "failed",
+                    {**(metadata or {}), "error": str(e)}
+                )
+            finally:
+                stream.close()
+    
+    def _set_status(
+        self,
+        document_id: str,
+        filename: str,
+        status: str,
+        metadata: Optional[Dict[str, Any]]
+    ):
+        """Record the status of a document that has not been processed yet."""
+        self._documents[document_id] = {
+            "document_id": document_id,
+            "filename": filename,
+            "chunks_count": 0,
+            "status": status,
+            "metadata": metadata or {}
+        }
+    
+    async def ingest_document(
+        self,
+        source: Union[str, BinaryIO],
+        filename: str,
+        metadata: Dict[str, Any] = None,
+        document_id: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Ingest a document: extract text, chunk, embed, and store.
         
         Args:
-            file_path: Path to the document file
+            source: Path to the document file, or a binary stream of it
             filename: Original filename
             metadata: Additional metadata
+            document_id: Pre-assigned document ID; generated if omitted
             
         Returns:
             Dictionary with document_id and status
         """
         try:
-            # Step 1: Extract text
-            doc_data = self.ingester.ingest_file(
-                file_path=file_path,
+            # Step 1: Extract text (file IO and parsing run off the event loop)
+            doc_data = await asyncio.to_thread(
+                self.ingester.ingest_file,
+                source=source,
                 filename=filename,
-                metadata=metadata
+                metadata=metadata,
+                document_id=document_id
             )
             document_id = doc_data["document_id"]
             
             # Step 2: Chunk text
-            chunks = self.chunker.chunk_text(
+            chunks = await asyncio.to_thread(
+                self.chunker.chunk_text,
                 text=doc_data["text"],
                 metadata={
                     "document_id": document_id,
@@ -63,7 +176,7 @@ class DocumentService:
             
             # Step 3: Generate embeddings
             chunk_texts = [chunk["text"] for chunk in chunks]
-            embeddings = self.embedding_service.generate_embeddings(chunk_texts)
+            embeddings = await self.embedding_service.generate_embeddings(chunk_texts)
             
             # Step 4: Prepare vectors for storage
             vector_ids = [chunk["chunk_id"] for chunk in chunks]
@@ -79,7 +192,7 @@ class DocumentService:
             ]
             
             # Step 5: Store in vector database
-            self.vector_db_service.upsert_vectors(
+            await self.vector_db_service.upsert_vectors_async(
                 vectors=embeddings,
                 ids=vector_ids,
                 metadata=vector_metadata
@@ -109,7 +222,14 @@ class DocumentService:
     
     def get_document_status(self, document_id: str) -> Dict[str, Any]:
         """Get status of a document."""
-        if document_id not in self._documents:
+        document = self._documents.get(document_id)
+        if document is None:
             raise ValueError(f"Document {document_id} not found")
         
-        return self._documents[document_id]
+        return document
+
+
+@lru_cache(maxsize=1)
+def get_document_service() -> DocumentService:
+    """Return the process-wide document service."""
+    return DocumentService()
@@ -0,0 +1,152 @@
+"""
+Persistent cache for text embeddings.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, Optional, Sequence
+import numpy as np
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Stay under SQLite's bound-parameter limit on older builds
+_MAX_QUERY_PARAMS = 500
+
+# Each storage dtype gets its own table so switching dtypes never
+# misreads vectors written under the other one
+_TABLES = {"float32": "embeddings", "float16": "embeddings_float16"}
+
+# Pruning removes this fraction of max_entries beyond the excess, so a
+# full cache is not pruned again on every store
+_PRUNE_SLACK = 0.05
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed mapping from (model, text) to embedding vector.
+
+    Keys are BLAKE2b digests of the model name and text, so re-embedding
+    the same chunk or query under the same model is served from disk.
+    Vectors are stored as raw bytes of the given dtype; float16 halves the
+    file and read volume at a relative error (~1e-3) far below what moves
+    cosine rankings. Lookups always return float32.
+
+    With max_entries set, the least recently read or written entries are
+    deleted once the table grows past it. Recency is a counter stored per
+    row, so it survives restarts.
+    """
+
+    def __init__(self, path: str, dtype: str = "float32", max_entries: Optional[int] = None):
+        if dtype not in _TABLES:
+            raise ValueError(f"Unsupported embedding cache dtype: {dtype}")
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self._table = _TABLES[dtype]
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self._table} ("
+            "key BLOB PRIMARY KEY, vector BLOB NOT NULL, accessed_at INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self._conn.execute(f"PRAGMA table_info({self._table})")}
+        if "accessed_at" not in columns:
+            # Caches written before eviction existed; their rows start least recent
+            self._conn.execute(
+                f"ALTER TABLE {self._table} ADD COLUMN accessed_at INTEGER NOT NULL DEFAULT 0"
+            )
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {self._table}_accessed_at ON {self._table} (accessed_at)"
+        )
+        self._conn.commit()
+        self.max_entries = max_entries
+        self._clock, self._count = self._conn.execute(
+            f"SELECT COALESCE(MAX(accessed_at), 0), COUNT(*) FROM {self._table}"
+        ).fetchone()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> bytes:
+        """Return the cache key for text embedded with model_name."""
+        return hashlib.blake2b(f"{model_name}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+    def get_many(self, keys: Sequence[bytes]) -> Dict[bytes, np.ndarray]:
+        """
+        Look up cached embeddings.
+
+        Args:
+            keys: Cache keys from make_key
+
+        Returns:
+            Dictionary of the keys that were found and their embeddings
+        """
+        found: Dict[bytes, np.ndarray] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique), _MAX_QUERY_PARAMS):
+                batch = unique[start:start + _MAX_QUERY_PARAMS]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM {self._table} WHERE key IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=self.dtype).astype(np.float32)
+            if found and self.max_entries:
+                self._touch(list(found))
+        return found
+
+    def set_many(self, items: Dict[bytes, Sequence[float]]):
+        """Store embeddings under their cache keys."""
+        with self._lock:
+            self._clock += 1
+            rows = [
+                (key, np.asarray(vector, dtype=self.dtype).tobytes(), self._clock)
+                for key, vector in items.items()
+            ]
+            before = self._conn.total_changes
+            self._conn.executemany(
+                f"INSERT OR IGNORE INTO {self._table} (key, vector, accessed_at) VALUES (?, ?, ?)",
+                rows
+            )
+            inserted = self._conn.total_changes - before
+            self._count += inserted
+            if inserted < len(rows):
+                # Some keys were already cached; overwrite them
+                self._conn.executemany(
+                    f"UPDATE {self._table} SET vector = ?, accessed_at = ? WHERE key = ?",
+                    [(vector, clock, key) for key, vector, clock in rows]
+                )
+            if self.max_entries and self._count > self.max_entries:
+                self._prune()
+            self._conn.commit()
+
+    def _touch(self, keys: Sequence[bytes]):
+        """Mark keys as just used. Caller holds _lock."""
+        self._clock += 1
+        for start in range(0, len(keys), _MAX_QUERY_PARAMS):
+            batch = keys[start:start + _MAX_QUERY_PARAMS]
+            self._conn.execute(
+                f"UPDATE {self._table} SET accessed_at = ? WHERE key IN ({','.join('?' * len(batch))})",
+                [self._clock, *batch]
+            )
+        self._conn.commit()
+
+    def _prune(self):
+        """Delete the least recently used rows down to max_entries. Caller holds _lock."""
+        excess = self._count - self.max_entries + int(self.max_entries * _PRUNE_SLACK)
+        deleted = self._conn.execute(
+            f"DELETE FROM {self._table} WHERE key IN "
+            f"(SELECT key FROM {self._table} ORDER BY accessed_at LIMIT ?)",
+            (excess,)
+        ).rowcount
+        self._count -= deleted
+        logger.info(f"Pruned {deleted} least recently used embeddings from the cache")
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
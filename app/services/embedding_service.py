@@ -1,31 +1,64 @@
 """
 Embedding service for generating vector embeddings.
 """
-from typing import List, Dict, Any
+import asyncio
+from functools import lru_cache
+from typing import List, Optional, Set, Tuple, Type
+import numpy as np
+import orjson
 from app.config import settings
+from app.services.embedding_cache import EmbeddingCache
+from app.utils.http import (
+    TRANSPORT_ERRORS, RetryableHTTPStatusError, get_async_http_client, raise_for_status
+)
 from app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
 
 class EmbeddingService:
-    """Service for generating text embeddings."""
-    
+    """
+    Service for generating text embeddings.
+
+    Texts submitted by concurrent callers are coalesced by a background
+    worker into a single provider call per batching window. Up to
+    ``embedding_max_concurrency`` batches are in flight at once, so a large
+    ingest does not make queries wait for each of its batches in turn.
+    """
+
     def __init__(self):
         self.model_name = settings.embedding_model
         self.provider = settings.embedding_provider
         self.dimension = settings.embedding_dimension
+        self.max_batch_size = settings.embedding_max_batch_size
+        self.max_latency_ms = settings.embedding_max_latency_ms
+        self.max_concurrency = settings.embedding_max_concurrency
         self._client = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flushes: Set[asyncio.Task] = set()  # Keeps in-flight batches referenced
+        self._cache: Optional[EmbeddingCache] = None
+        # Errors a retry may fix; set per provider
+        self.transient_errors: Tuple[Type[BaseException], ...] = ()
         self._initialize_client()
-    
+        self._initialize_cache()
+
     def _initialize_client(self):
         """Initialize the embedding client."""
         if self.provider == "openai":
             try:
-                import openai
                 if not settings.openai_api_key:
                     raise ValueError("OpenAI API key not configured")
-                self._client = openai.OpenAI(api_key=settings.openai_api_key)
+                # Only the vectors are needed, so the endpoint is called
+                # directly rather than through the SDK's response models
+                self._client = get_async_http_client()
+                self._embeddings_url = f"{settings.openai_base_url.rstrip('/')}/embeddings"
+                self._headers = {
+                    "Authorization": f"Bearer {settings.openai_api_key}",
+                    "Content-Type": "application/json"
+                }
+                self.transient_errors = TRANSPORT_ERRORS + (RetryableHTTPStatusError,)
                 logger.info("Initialized OpenAI embedding client")
             except Exception as e:
                 logger.error(f"Failed to initialize OpenAI client: {str(e)}")
@@ -40,53 +73,190 @@ class EmbeddingService:
             except Exception as e:
                 logger.error(f"Failed to initialize SentenceTransformer: {str(e)}")
                 raise
-    
-    def generate_embeddings(
-        self,
-        texts: List[str],
-        batch_size: int = 100
-    ) -> List[List[float]]:
+
+    def _initialize_cache(self):
+        """Open the persistent embedding cache if enabled."""
+        if not settings.embedding_cache_path:
+            return
+        try:
+            self._cache = EmbeddingCache(
+                settings.embedding_cache_path,
+                dtype=settings.embedding_cache_dtype,
+                max_entries=settings.embedding_cache_max_entries or None
+            )
+            logger.info(f"Opened embedding cache at {settings.embedding_cache_path}")
+        except Exception as e:
+            logger.warning(f"Embedding cache disabled: {str(e)}")
+
+    async def generate_embeddings(self, texts: List[str]) -> np.ndarray:
         """
         Generate embeddings for a list of texts.
-        
+
+        Texts found in the embedding cache are returned without a provider
+        call. The rest are deduplicated and enqueued for the batch worker,
+        which may combine them with texts from other callers into one
+        provider request.
+
         Args:
             texts: List of text strings to embed
-            batch_size: Batch size for processing
-            
+
         Returns:
-            List of embedding vectors
+            float32 array of shape (len(texts), dimension)
         """
         if not texts:
-            return []
-        
-        embeddings = []
-        
+            return np.empty((0, self.dimension), dtype=np.float32)
+
+        namespace = f"{self.provider}/{self.model_name}"
+        keys = [EmbeddingCache.make_key(namespace, text) for text in texts]
+        cached = {}
+        if self._cache is not None:
+            cached = await asyncio.to_thread(self._cache.get_many, keys)
+
+        misses = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                misses.setdefault(key, text)
+
+        if misses:
+            queue = self._ensure_worker()
+            loop = asyncio.get_running_loop()
+
+            futures = []
+            for text in misses.values():
+                future = loop.create_future()
+                queue.put_nowait((text, future))
+                futures.append(future)
+
+            try:
+                embedded = await asyncio.gather(*futures)
+            except Exception as e:
+                logger.error(f"Error generating embeddings: {str(e)}")
+                raise
+
+            fresh = dict(zip(misses, embedded))
+            if self._cache is not None:
+                await asyncio.to_thread(self._cache.set_many, fresh)
+            cached.update(fresh)
+
+        # The provider's vector width wins over the configured dimension
+        width = len(next(iter(cached.values())))
+        embeddings = np.empty((len(texts), width), dtype=np.float32)
+        for row, key in enumerate(keys):
+            embeddings[row] = cached[key]
+
+        logger.info(f"Generated {len(misses)} embeddings ({len(texts) - len(misses)} from cache)")
+        return embeddings
+
+    async def generate_embedding(self, text: str) -> np.ndarray:
+        """Generate embedding for a single text."""
+        return (await self.generate_embeddings([text]))[0]
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        """Start the batch worker on the running event loop if needed."""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._queue = asyncio.Queue()
+            self._loop = loop
+            self._worker = loop.create_task(self._batch_worker(self._queue))
+        return self._queue
+
+    async def _batch_worker(self, queue: asyncio.Queue):
+        """
+        Drain the queue into provider calls.
+
+        A batch is flushed once it holds ``max_batch_size`` texts or
+        ``max_latency_ms`` has elapsed since its first text arrived. Each
+        flushed batch runs as its own task, so the worker keeps collecting
+        the next batch while earlier ones wait on the provider. Once
+        ``max_concurrency`` batches are in flight the worker waits for a
+        slot, and texts keep coalescing in the queue meanwhile.
+        """
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.max_concurrency)
+
+        while True:
+            batch: List[Tuple[str, asyncio.Future]] = [await queue.get()]
+            deadline = loop.time() + self.max_latency_ms / 1000
+
+            while len(batch) < self.max_batch_size:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Skip texts whose callers have gone away
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            await slots.acquire()
+            flush = loop.create_task(self._flush_batch(batch, slots))
+            self._flushes.add(flush)
+            flush.add_done_callback(self._flushes.discard)
+
+    async def _flush_batch(
+        self,
+        batch: List[Tuple[str, asyncio.Future]],
+        slots: asyncio.Semaphore
+    ):
+        """Embed one batch and resolve its callers' futures."""
         try:
-            if self.provider == "openai" and self._client:
-                # Process in batches
-                for i in range(0, len(texts), batch_size):
-                    batch = texts[i:i + batch_size]
-                    response = self._client.embeddings.create(
-                        model=self.model_name,
-                        input=batch
-                    )
-                    batch_embeddings = [item.embedding for item in response.data]
-                    embeddings.extend(batch_embeddings)
-            else:
-                # Use sentence transformers
-                embeddings = self._client.encode(
-                    texts,
-                    batch_size=batch_size,
-                    show_progress_bar=False
-                ).tolist()
-            
-            logger.info(f"Generated {len(embeddings)} embeddings")
-            return embeddings
-            
+            embeddings = await self._embed_batch([text for text, _ in batch])
+            if len(embeddings) != len(batch):
+                # Zipping a short response would leave some callers waiting forever
+                raise ValueError(
+                    f"Provider returned {len(embeddings)} embeddings for {len(batch)} texts"
+                )
         except Exception as e:
-            logger.error(f"Error generating embeddings: {str(e)}")
-            raise
-    
-    def generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding for a single text."""
-        return self.generate_embeddings([text])[0]
+            logger.error(f"Embedding batch of {len(batch)} texts failed: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            slots.release()
+
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+    async def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        """Embed one coalesced batch with the configured provider."""
+        if self.provider == "openai":
+            response = await self._client.post(
+                self._embeddings_url,
+                content=orjson.dumps({"model": self.model_name, "input": texts}),
+                headers=self._headers
+            )
+            raise_for_status(response)
+            body = orjson.loads(response.content)
+            # Each item carries the position of its input; don't rely on list order
+            data = sorted(body["data"], key=lambda item: item["index"])
+            return np.array([item["embedding"] for item in data], dtype=np.float32)
+
+        # SentenceTransformer.encode is CPU-bound; keep it off the event loop
+        encoded = await asyncio.to_thread(
+            self._client.encode,
+            texts,
+            batch_size=len(texts),
+            show_progress_bar=False,
+            convert_to_numpy=True
+        )
+        return encoded.astype(np.float32, copy=False)
+
+
+@lru_cache(maxsize=1)
+def get_embedding_service() -> EmbeddingService:
+    """
+    Return the process-wide embedding service.
+
+    Sharing one instance means a single batch queue, provider client and
+    cache connection for both ingestion and queries.
+    """
+    return EmbeddingService()
@@ -0,0 +1,238 @@
+"""
+In-process HNSW vector index.
+"""
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+import orjson
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class _ReadWriteLock:
+    """
+    Lock shared by any number of readers or held by a single writer.
+
+    Waiting writers block new readers, so a steady stream of queries
+    cannot starve upserts.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+class HNSWIndex:
+    """
+    Cosine-similarity index backed by hnswlib.
+
+    String ids are mapped to integer labels; upserting an existing id
+    replaces its vector and metadata. The index is created on the first
+    upsert, once the vector dimension is known, and grows as needed.
+    save and load persist the graph with ids and metadata, so a restart
+    reuses it instead of rebuilding from the vectors.
+    """
+
+    def __init__(
+        self,
+        max_elements: int,
+        m: int = 16,
+        ef_construction: int = 64,
+        ef_search: int = 40
+    ):
+        import hnswlib
+        self._hnswlib = hnswlib
+        self.max_elements = max_elements
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._index = None
+        self._labels: Dict[str, int] = {}
+        self._records: Dict[int, Dict[str, Any]] = {}
+        # Queries share it; upserts and loads take it exclusively
+        self._lock = _ReadWriteLock()
+        # Held by upserts and save, so a save sees a stable index without
+        # blocking queries on _lock
+        self._save_lock = threading.Lock()
+        self._graph_path: Optional[str] = None  # Graph file of the last save or load
+
+    def upsert(
+        self,
+        vectors: np.ndarray,
+        ids: List[str],
+        metadata: List[Dict[str, Any]]
+    ):
+        """Add or replace vectors under their ids."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return
+
+        with self._save_lock, self._lock.write():
+            if self._index is None:
+                self._index = self._hnswlib.Index(space="cosine", dim=vectors.shape[1])
+                self._index.init_index(
+                    max_elements=self.max_elements,
+                    ef_construction=self.ef_construction,
+                    M=self.m
+                )
+                self._index.set_ef(self.ef_search)
+
+            labels = []
+            for id, meta in zip(ids, metadata):
+                label = self._labels.setdefault(id, len(self._labels))
+                self._records[label] = {"id": id, "metadata": meta}
+                labels.append(label)
+
+            capacity = self._index.get_max_elements()
+            if len(self._labels) > capacity:
+                self._index.resize_index(max(len(self._labels), capacity * 2))
+
+            self._index.add_items(vectors, np.asarray(labels, dtype=np.int64))
+
+    def query(
+        self,
+        vector: np.ndarray,
+        top_k: int,
+        filter_dict: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Return the top_k nearest vectors as result dictionaries.
+
+        Args:
+            vector: Query vector
+            top_k: Number of results to return
+            filter_dict: Optional metadata equality filters
+
+        Returns:
+            List of results with ids, cosine similarity scores, and metadata
+        """
+        # hnswlib releases the GIL while searching, so concurrent queries
+        # run in parallel under the shared lock
+        with self._lock.read():
+            if self._index is None or not self._records:
+                return []
+
+            label_filter: Optional[Callable[[int], bool]] = None
+            candidates = len(self._records)
+            if filter_dict:
+                def label_filter(label: int) -> bool:
+                    meta = self._records[label]["metadata"]
+                    return all(meta.get(key) == value for key, value in filter_dict.items())
+                # hnswlib raises if fewer than k labels pass the filter
+                candidates = sum(1 for label in self._records if label_filter(label))
+                if candidates == 0:
+                    return []
+
+            k = min(top_k, candidates)
+            # hnswlib searches with max(ef, k) candidates, so ef never needs raising per query
+            labels, distances = self._index.knn_query(
+                np.asarray(vector, dtype=np.float32), k=k, filter=label_filter
+            )
+
+            records = self._records
+            scores = (1.0 - distances[0]).tolist()
+            return [
+                {
+                    "id": records[label]["id"],
+                    "score": score,
+                    "metadata": records[label]["metadata"]
+                }
+                for label, score in zip(labels[0].tolist(), scores)
+            ]
+
+    def save(self, path: str):
+        """
+        Write the index so that load(path) restores it.
+        
+        The graph goes to a new file, path + ".<save id>.bin", which is named
+        in the ids-and-metadata manifest at path + ".meta". The manifest is
+        replaced last with a single rename and the previous graph removed
+        afterwards, so a crash mid-save leaves the last complete save
+        loadable. Queries proceed during the write; upserts wait for it.
+        """
+        with self._save_lock:
+            if self._index is None:
+                return
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            
+            # Upserts are excluded by _save_lock and queries only read, so the
+            # graph and records are stable without holding the query lock
+            graph_path = f"{path}.{uuid.uuid4().hex}.bin"
+            self._index.save_index(graph_path)
+            manifest = orjson.dumps({
+                "graph": os.path.basename(graph_path),
+                "dim": self._index.dim,
+                "records": [
+                    [label, record["id"], record["metadata"]]
+                    for label, record in self._records.items()
+                ]
+            })
+            with open(path + ".meta.tmp", "wb") as f:
+                f.write(manifest)
+            os.replace(path + ".meta.tmp", path + ".meta")
+            
+            previous, self._graph_path = self._graph_path, graph_path
+            if previous is not None and os.path.exists(previous):
+                os.remove(previous)
+    
+    def load(self, path: str):
+        """Replace the contents of this index with the last save to path."""
+        with open(path + ".meta", "rb") as f:
+            manifest = orjson.loads(f.read())
+        graph_path = os.path.join(os.path.dirname(path), manifest["graph"])
+        
+        index = self._hnswlib.Index(space="cosine", dim=manifest["dim"])
+        # max_elements=0 keeps the saved capacity; upserts grow it as before
+        index.load_index(graph_path, max_elements=0)
+        if index.get_current_count() != len(manifest["records"]):
+            raise ValueError(f"HNSW graph {graph_path} does not match {path}.meta")
+        index.set_ef(self.ef_search)
+        
+        with self._save_lock, self._lock.write():
+            self._index = index
+            self._graph_path = graph_path
+            self._records = {
+                label: {"id": id, "metadata": meta}
+                for label, id, meta in manifest["records"]
+            }
+            self._labels = {record["id"]: label for label, record in self._records.items()}
+    
+    def __len__(self) -> int:
+        return len(self._records)
@@ -0,0 +1,229 @@
+"""
+In-process IVF vector index with an HNSW coarse quantizer.
+"""
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# faiss scalar quantizer type for each cell storage option; None keeps float32
+_STORAGE_TYPES = {"float32": None, "float16": "QT_fp16", "int8": "QT_8bit"}
+
+
+class IVFHNSWIndex:
+    """
+    Cosine-similarity IVF index backed by faiss, for corpora too large for HNSW.
+
+    Vectors are partitioned into nlist k-means cells. The cell centroids
+    are searched with HNSW, and a query scans only the nprobe nearest
+    cells. Cells are learned from a sample of the first train_size
+    vectors; until then vectors are kept in a flat index and searched
+    exactly. storage selects how vectors are kept in the cells: float32,
+    float16, or int8 scalar codes. Training runs on a snapshot without
+    holding the lock, so queries and upserts continue against the flat
+    index meanwhile; upserts made during training are replayed into the
+    IVF index before it replaces the flat one.
+
+    String ids are mapped to integer labels; upserting an existing id
+    replaces its vector and metadata.
+    """
+
+    def __init__(
+        self,
+        nlist: int,
+        nprobe: int = 32,
+        train_size: int = 100_000,
+        m: int = 12,
+        ef_construction: int = 15,
+        storage: str = "float32",
+        seed: int = 0
+    ):
+        import faiss
+        if storage not in _STORAGE_TYPES:
+            raise ValueError(f"Unsupported IVF storage: {storage}")
+        if train_size < nlist:
+            raise ValueError("ivf_train_size must be at least ivf_nlist")
+        self._faiss = faiss
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.m = m
+        self.ef_construction = ef_construction
+        self.storage = storage
+        self._rng = np.random.default_rng(seed)
+        self._index = None
+        self._trained = False
+        # Upserts made while training, as (vectors, labels, replaced); None when not training
+        self._training_log: Optional[List[Tuple[np.ndarray, np.ndarray, np.ndarray]]] = None
+        self._labels: Dict[str, int] = {}
+        self._records: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def upsert(
+        self,
+        vectors: np.ndarray,
+        ids: List[str],
+        metadata: List[Dict[str, Any]]
+    ):
+        """Add or replace vectors under their ids."""
+        vectors = np.array(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return
+        # Unit vectors make inner product equal cosine similarity
+        self._faiss.normalize_L2(vectors)
+
+        with self._lock:
+            if self._index is None:
+                self._index = self._faiss.IndexIDMap(
+                    self._faiss.IndexFlatIP(vectors.shape[1])
+                )
+
+            labels = np.empty(len(ids), dtype=np.int64)
+            replaced = []
+            for i, (id, meta) in enumerate(zip(ids, metadata)):
+                label = self._labels.get(id)
+                if label is None:
+                    label = self._labels[id] = len(self._labels)
+                else:
+                    replaced.append(label)
+                self._records[label] = {"id": id, "metadata": meta}
+                labels[i] = label
+
+            replaced = np.asarray(replaced, dtype=np.int64)
+            if len(replaced):
+                self._index.remove_ids(replaced)
+            self._index.add_with_ids(vectors, labels)
+            if self._training_log is not None:
+                self._training_log.append((vectors, labels, replaced))
+
+            snapshot = None
+            if (
+                not self._trained
+                and self._training_log is None
+                and self._index.ntotal >= self.train_size
+            ):
+                flat = self._index
+                snapshot = (
+                    flat.index.reconstruct_n(0, flat.ntotal),
+                    self._faiss.vector_to_array(flat.id_map).astype(np.int64)
+                )
+                self._training_log = []
+
+        if snapshot is not None:
+            self._train(*snapshot)
+
+    def _train(self, vectors: np.ndarray, labels: np.ndarray):
+        """
+        Learn the cells from a snapshot of the flat index and swap in the IVF index.
+
+        Runs without the lock; upserts logged since the snapshot are applied
+        to the new index under the lock just before it is swapped in.
+        """
+        try:
+            index = self._build_ivf(vectors, labels)
+        except Exception:
+            with self._lock:
+                self._training_log = None
+            raise
+
+        with self._lock:
+            for logged_vectors, logged_labels, replaced in self._training_log:
+                if len(replaced):
+                    index.remove_ids(replaced)
+                index.add_with_ids(logged_vectors, logged_labels)
+            self._index = index
+            self._trained = True
+            self._training_log = None
+
+    def _build_ivf(self, vectors: np.ndarray, labels: np.ndarray):
+        """Train an IVF index on vectors and add them under labels."""
+        dim = vectors.shape[1]
+
+        quantizer = self._faiss.IndexHNSWFlat(dim, self.m, self._faiss.METRIC_INNER_PRODUCT)
+        quantizer.hnsw.efConstruction = self.ef_construction
+        # HNSW returns nprobe centroids per query, so its candidate list must cover them
+        quantizer.hnsw.efSearch = max(2 * self.nprobe, 16)
+        storage_type = _STORAGE_TYPES[self.storage]
+        if storage_type is None:
+            index = self._faiss.IndexIVFFlat(
+                quantizer, dim, self.nlist, self._faiss.METRIC_INNER_PRODUCT
+            )
+        else:
+            index = self._faiss.IndexIVFScalarQuantizer(
+                quantizer,
+                dim,
+                self.nlist,
+                getattr(self._faiss.ScalarQuantizer, storage_type),
+                self._faiss.METRIC_INNER_PRODUCT
+            )
+
+        sample = vectors
+        if len(vectors) > self.train_size:
+            sample = vectors[self._rng.choice(len(vectors), self.train_size, replace=False)]
+        logger.info(f"Training IVF index with {self.nlist} cells on {len(sample)} vectors")
+        index.train(sample)
+        index.add_with_ids(vectors, labels)
+        index.nprobe = self.nprobe
+        return index
+
+    def query(
+        self,
+        vector: np.ndarray,
+        top_k: int,
+        filter_dict: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Return the top_k nearest vectors as result dictionaries.
+
+        Args:
+            vector: Query vector
+            top_k: Number of results to return
+            filter_dict: Optional metadata equality filters
+
+        Returns:
+            List of results with ids, cosine similarity scores, and metadata
+        """
+        query = np.array([vector], dtype=np.float32)
+        self._faiss.normalize_L2(query)
+
+        with self._lock:
+            if self._index is None or not self._records:
+                return []
+
+            params = None
+            if filter_dict:
+                allowed = np.fromiter(
+                    (
+                        label for label, record in self._records.items()
+                        if all(record["metadata"].get(key) == value
+                               for key, value in filter_dict.items())
+                    ),
+                    dtype=np.int64
+                )
+                if len(allowed) == 0:
+                    return []
+                selector = self._faiss.IDSelectorBatch(allowed)
+                if self._trained:
+                    params = self._faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+                else:
+                    params = self._faiss.SearchParameters(sel=selector)
+
+            k = min(top_k, len(self._records))
+            scores, labels = self._index.search(query, k, params=params)
+
+            records = self._records
+            return [
+                {
+                    "id": records[label]["id"],
+                    "score": score,
+                    "metadata": records[label]["metadata"]
+                }
+                # faiss pads with -1 when fewer than k vectors are found
+                for label, score in zip(labels[0].tolist(), scores[0].tolist())
+                if label >= 0
+            ]
+
+    def __len__(self) -> int:
+        return len(self._records)
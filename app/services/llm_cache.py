@@ -0,0 +1,104 @@
+"""
+Semantic cache for LLM responses.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class SemanticResponseCache:
+    """
+    Cache of generated answers keyed by query embedding similarity.
+
+    Recent query embeddings are held in an in-memory HNSW index. A lookup
+    hits when the nearest cached query is at least ``similarity_threshold``
+    cosine-similar and the chunks the cached answer was grounded on lead the
+    current context in the same order, so its [Document N] references still
+    point at the same sources. Entries are evicted least recently used.
+    """
+
+    def __init__(self, max_entries: int, similarity_threshold: float):
+        import hnswlib
+        self._hnswlib = hnswlib
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self._index = None  # Created on first store, once the dimension is known
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_label = 0
+        self._lock = threading.Lock()
+
+    def lookup(
+        self,
+        query_embedding: List[float],
+        chunk_ids: Sequence[str],
+        include_citations: bool
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Return a cached response for a semantically matching query.
+
+        Args:
+            query_embedding: Embedding of the incoming query
+            chunk_ids: IDs of the chunks retrieved for the incoming query
+            include_citations: Whether the answer should cite sources
+
+        Returns:
+            Cached response dictionary, or None on a miss
+        """
+        with self._lock:
+            if not self._entries:
+                return None
+
+            vector = np.asarray(query_embedding, dtype=np.float32)
+            labels, distances = self._index.knn_query(vector, k=1)
+            label = int(labels[0][0])
+            similarity = 1.0 - float(distances[0][0])
+
+            entry = self._entries.get(label)
+            if entry is None or similarity < self.similarity_threshold:
+                return None
+            if entry["include_citations"] != include_citations:
+                return None
+            cached_ids = entry["chunk_ids"]
+            if tuple(chunk_ids[:len(cached_ids)]) != cached_ids:
+                return None
+
+            self._entries.move_to_end(label)
+            logger.info(f"Semantic cache hit (similarity {similarity:.3f})")
+            return entry["response"]
+
+    def store(
+        self,
+        query_embedding: List[float],
+        chunk_ids: Sequence[str],
+        include_citations: bool,
+        response: Dict[str, Any]
+    ) -> None:
+        """Cache a generated response for future similar queries."""
+        vector = np.asarray(query_embedding, dtype=np.float32)
+
+        with self._lock:
+            if self._index is None:
+                self._index = self._hnswlib.Index(space="cosine", dim=vector.shape[0])
+                self._index.init_index(
+                    max_elements=self.max_entries,
+                    ef_construction=100,
+                    M=16,
+                    allow_replace_deleted=True
+                )
+
+            if len(self._entries) >= self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._index.mark_deleted(evicted)
+
+            label = self._next_label
+            self._next_label += 1
+            self._index.add_items(vector[np.newaxis, :], [label], replace_deleted=True)
+            self._entries[label] = {
+                "chunk_ids": tuple(chunk_ids),
+                "include_citations": include_citations,
+                "response": response
+            }
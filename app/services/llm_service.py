@@ -1,12 +1,37 @@
 """
 LLM service for generating responses with RAG.
 """
-from typing import List, Dict, Any, Optional
+import asyncio
+from functools import lru_cache
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple, Type
+import orjson
 from app.config import settings
+from app.services.llm_cache import SemanticResponseCache
+from app.utils.http import get_async_http_client
 from app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+# Provider SDKs are optional; only the configured one has to be installed
+try:
+    import openai
+except ImportError:
+    openai = None
+
+try:
+    import anthropic
+except ImportError:
+    anthropic = None
+
+
+def _sdk_transient_errors(sdk) -> Tuple[Type[BaseException], ...]:
+    """Errors from an openai/anthropic SDK that a retry may fix."""
+    return (
+        sdk.APIConnectionError,  # includes APITimeoutError
+        sdk.RateLimitError,
+        sdk.InternalServerError
+    )
+
 
 class LLMService:
     """Service for LLM interactions."""
@@ -15,28 +40,43 @@ class LLMService:
         self.provider = settings.llm_provider
         self.temperature = settings.temperature
         self._client = None
+        self._response_cache: Optional[SemanticResponseCache] = None
+        # Errors a retry may fix; set per provider
+        self.transient_errors: Tuple[Type[BaseException], ...] = ()
         self._initialize_client()
+        self._initialize_cache()
     
     def _initialize_client(self):
         """Initialize the LLM client."""
         if self.provider == "openai":
             try:
-                import openai
+                if openai is None:
+                    raise ImportError("openai package is not installed")
                 if not settings.openai_api_key:
                     raise ValueError("OpenAI API key not configured")
-                self._client = openai.OpenAI(api_key=settings.openai_api_key)
+                self._client = openai.AsyncOpenAI(
+                    api_key=settings.openai_api_key,
+                    base_url=settings.openai_base_url,
+                    http_client=get_async_http_client()
+                )
                 self.model = "gpt-4-turbo-preview"
+                self.transient_errors = _sdk_transient_errors(openai)
                 logger.info("Initialized OpenAI LLM client")
             except Exception as e:
                 logger.error(f"Failed to initialize OpenAI client: {str(e)}")
                 raise
         elif self.provider == "anthropic":
             try:
-                import anthropic
+                if anthropic is None:
+                    raise ImportError("anthropic package is not installed")
                 if not settings.anthropic_api_key:
                     raise ValueError("Anthropic API key not configured")
-                self._client = anthropic.Anthropic(api_key=settings.anthropic_api_key)
+                self._client = anthropic.AsyncAnthropic(
+                    api_key=settings.anthropic_api_key,
+                    http_client=get_async_http_client()
+                )
                 self.model = "claude-3-opus-20240229"
+                self.transient_errors = _sdk_transient_errors(anthropic)
                 logger.info("Initialized Anthropic LLM client")
             except Exception as e:
                 logger.error(f"Failed to initialize Anthropic client: {str(e)}")
@@ -44,11 +84,25 @@ class LLMService:
         else:
             raise ValueError(f"Unsupported LLM provider: {self.provider}")
     
-    def generate_response(
+    def _initialize_cache(self):
+        """Initialize the semantic response cache if enabled."""
+        if settings.llm_cache_size <= 0:
+            return
+        try:
+            self._response_cache = SemanticResponseCache(
+                max_entries=settings.llm_cache_size,
+                similarity_threshold=settings.llm_cache_similarity_threshold
+            )
+            logger.info(f"Initialized semantic response cache ({settings.llm_cache_size} entries)")
+        except ImportError as e:
+            logger.warning(f"Semantic response cache disabled: {str(e)}")
+    
+    async def generate_response(
         self,
         query: str,
         context_chunks: List[Dict[str, Any]],
-        include_citations: bool = True
+        include_citations: bool = True,
+        query_embedding: Optional[List[float]] = None
     ) -> Dict[str, Any]:
         """
         Generate a response using RAG.
@@ -57,29 +111,185 @@ class LLMService:
             query: User query
             context_chunks: Retrieved context chunks
             include_citations: Whether to include citations
+            query_embedding: Embedding of the query; enables the semantic
+                response cache when provided
             
         Returns:
             Dictionary with answer and metadata
         """
+        chunk_ids = [chunk.get("chunk_id", "") for chunk in context_chunks]
+        use_cache = self._response_cache is not None and query_embedding is not None
+        if use_cache:
+            cached = self._response_cache.lookup(query_embedding, chunk_ids, include_citations)
+            if cached is not None:
+                return {**cached, "cached": True}
+        
         # Build context from chunks
         context = self._build_context(context_chunks)
         
         # Create prompt
         prompt = self._create_prompt(query, context, include_citations)
         
+        try:
+            answer = await self._complete(prompt)
+            
+            result = {
+                "answer": answer,
+                "model": self.model,
+                "provider": self.provider
+            }
+            if use_cache:
+                self._response_cache.store(query_embedding, chunk_ids, include_citations, result)
+            
+            return {**result, "cached": False}
+        except Exception as e:
+            logger.error(f"Error generating LLM response: {str(e)}")
+            raise
+    
+    async def generate_response_batch(
+        self,
+        items: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Generate responses for several queries with as few LLM calls as possible.
+        
+        Cache misses are packed, up to llm_batch_size at a time, into one
+        completion that returns a JSON object with an answer per query.
+        Queries the model leaves out of that object, or whose batch call
+        fails, fall back to generate_response.
+        
+        Args:
+            items: Dictionaries with the generate_response arguments
+                (query, context_chunks, include_citations, query_embedding)
+            
+        Returns:
+            List of answer dictionaries, in the same order as items
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        pending = []
+        for position, item in enumerate(items):
+            query_embedding = item.get("query_embedding")
+            if self._response_cache is not None and query_embedding is not None:
+                cached = self._response_cache.lookup(
+                    query_embedding,
+                    [chunk.get("chunk_id", "") for chunk in item["context_chunks"]],
+                    item.get("include_citations", True)
+                )
+                if cached is not None:
+                    results[position] = {**cached, "cached": True}
+                    continue
+            pending.append(position)
+        
+        groups = [
+            pending[start:start + settings.llm_batch_size]
+            for start in range(0, len(pending), settings.llm_batch_size)
+        ]
+        group_answers = await asyncio.gather(
+            *(self._answer_group([items[position] for position in group]) for group in groups)
+        )
+        
+        fallback = []
+        for group, answers in zip(groups, group_answers):
+            for position, answer in zip(group, answers):
+                if answer is None:
+                    fallback.append(position)
+                    continue
+                item = items[position]
+                result = {"answer": answer, "model": self.model, "provider": self.provider}
+                if self._response_cache is not None and item.get("query_embedding") is not None:
+                    self._response_cache.store(
+                        item["query_embedding"],
+                        [chunk.get("chunk_id", "") for chunk in item["context_chunks"]],
+                        item.get("include_citations", True),
+                        result
+                    )
+                results[position] = {**result, "cached": False}
+        
+        if fallback:
+            logger.info(f"Answering {len(fallback)} batched queries individually")
+            for position, result in zip(fallback, await asyncio.gather(
+                *(self.generate_response(**items[position]) for position in fallback)
+            )):
+                results[position] = result
+        
+        return results
+    
+    async def _answer_group(self, items: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """Answer queries in one completion; None marks queries left unanswered."""
+        if len(items) == 1:
+            # Nothing to pack; let the caller use the plain prompt
+            return [None]
+        
+        prompt = self._create_batch_prompt(items)
+        try:
+            content = await self._complete(
+                prompt,
+                json_output=True,
+                max_tokens=min(1024 * len(items), 4096)
+            )
+            parsed = orjson.loads(content)
+            answers = {
+                entry["id"]: entry["answer"]
+                for entry in parsed.get("answers", [])
+                if isinstance(entry, dict)
+                and isinstance(entry.get("id"), int)
+                and isinstance(entry.get("answer"), str)
+            }
+        except Exception as e:
+            logger.error(f"Batched LLM response failed: {str(e)}")
+            return [None] * len(items)
+        
+        return [answers.get(number) for number in range(1, len(items) + 1)]
+    
+    async def stream_response(
+        self,
+        query: str,
+        context_chunks: List[Dict[str, Any]],
+        include_citations: bool = True,
+        query_embedding: Optional[List[float]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Generate a response using RAG, yielding text as it is produced.
+        
+        Args:
+            query: User query
+            context_chunks: Retrieved context chunks
+            include_citations: Whether to include citations
+            query_embedding: Embedding of the query; enables the semantic
+                response cache when provided
+            
+        Yields:
+            Pieces of the answer text
+        """
+        chunk_ids = [chunk.get("chunk_id", "") for chunk in context_chunks]
+        use_cache = self._response_cache is not None and query_embedding is not None
+        if use_cache:
+            cached = self._response_cache.lookup(query_embedding, chunk_ids, include_citations)
+            if cached is not None:
+                yield cached["answer"]
+                return
+        
+        context = self._build_context(context_chunks)
+        prompt = self._create_prompt(query, context, include_citations)
+        parts = []
+        
         try:
             if self.provider == "openai":
-                response = self._client.chat.completions.create(
+                stream = await self._client.chat.completions.create(
                     model=self.model,
                     messages=[
                         {"role": "system", "content": self._get_system_prompt()},
                         {"role": "user", "content": prompt}
                     ],
-                    temperature=self.temperature
+                    temperature=self.temperature,
+                    stream=True
                 )
-                answer = response.choices[0].message.content
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
             elif self.provider == "anthropic":
-                response = self._client.messages.create(
+                async with self._client.messages.stream(
                     model=self.model,
                     max_tokens=1024,
                     temperature=self.temperature,
@@ -87,17 +297,52 @@ class LLMService:
                     messages=[
                         {"role": "user", "content": prompt}
                     ]
-                )
-                answer = response.content[0].text
-            
-            return {
-                "answer": answer,
-                "model": self.model,
-                "provider": self.provider
-            }
+                ) as stream:
+                    async for text in stream.text_stream:
+                        parts.append(text)
+                        yield text
         except Exception as e:
-            logger.error(f"Error generating LLM response: {str(e)}")
+            logger.error(f"Error streaming LLM response: {str(e)}")
             raise
+        
+        if use_cache:
+            self._response_cache.store(
+                query_embedding,
+                chunk_ids,
+                include_citations,
+                {"answer": "".join(parts), "model": self.model, "provider": self.provider}
+            )
+    
+    async def _complete(
+        self,
+        prompt: str,
+        json_output: bool = False,
+        max_tokens: int = 1024
+    ) -> str:
+        """Run a single non-streaming completion and return its text."""
+        if self.provider == "openai":
+            extra = {"response_format": {"type": "json_object"}} if json_output else {}
+            response = await self._client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": self._get_system_prompt()},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=self.temperature,
+                **extra
+            )
+            return response.choices[0].message.content
+        
+        response = await self._client.messages.create(
+            model=self.model,
+            max_tokens=max_tokens,
+            temperature=self.temperature,
+            system=self._get_system_prompt(),
+            messages=[
+                {"role": "user", "content": prompt}
+            ]
+        )
+        return response.content[0].text
     
     def _build_context(self, chunks: List[Dict[str, Any]]) -> str:
         """Build context string from retrieved chunks."""
@@ -133,6 +378,32 @@ Question: {query}
 Answer:"""
         return prompt
     
+    def _create_batch_prompt(self, items: List[Dict[str, Any]]) -> str:
+        """Create one prompt that asks for a JSON answer to each query."""
+        sections = []
+        for number, item in enumerate(items, 1):
+            citation_instruction = ""
+            if item.get("include_citations", True):
+                citation_instruction = (
+                    "\nCite the document number of this question's context "
+                    "(e.g., [Document 1]) when referencing it."
+                )
+            sections.append(
+                f"Question {number}: {item['query']}{citation_instruction}\n\n"
+                f"Context for question {number}:\n{self._build_context(item['context_chunks'])}"
+            )
+        questions = "\n\n".join(sections)
+        
+        prompt = f"""Answer each of the following questions using only the context given for it.
+[Document N] numbers refer to the context of the question they appear under.
+If an answer cannot be found in its context, say so clearly.
+
+{questions}
+
+Respond with a JSON object of the form {{"answers": [{{"id": 1, "answer": "..."}}]}},
+with one entry per question, where id is the question number."""
+        return prompt
+    
     def _get_system_prompt(self) -> str:
         """Get the system prompt for the LLM."""
         return (
@@ -141,3 +412,9 @@ Answer:"""
             "If the context doesn't contain enough information to answer the question, "
             "say so clearly rather than making up information."
         )
+
+
+@lru_cache(maxsize=1)
+def get_llm_service() -> LLMService:
+    """Return the process-wide LLM service."""
+    return LLMService()
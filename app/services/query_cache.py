@@ -0,0 +1,199 @@
+"""
+Two-tier cache for full query answers.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+import numpy as np
+from app.utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class QueryCache:
+    """
+    Cache of retrieve_and_answer results.
+
+    The exact tier is keyed on the query text and retrieval parameters and
+    is checked before the query is embedded. The semantic tier returns the
+    answer of a previous query with the same parameters whose embedding is
+    at least ``similarity_threshold`` cosine-similar. Candidates for the
+    semantic tier are narrowed with random-projection LSH: each of
+    ``lsh_tables`` tables hashes an embedding to the sign pattern of
+    ``lsh_bits`` projections, and only entries sharing a bucket in some
+    table are compared. Embeddings are stored unit-normalized in a C-ordered
+    float32 matrix, so similarities are a single BLAS matrix-vector product.
+    Entries are evicted least recently used, and expire ``ttl_s`` seconds
+    after they are stored. sync only sees writes made by this process, so
+    the TTL bounds how stale an answer can be when other processes write
+    to a shared vector store.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        similarity_threshold: float,
+        lsh_bits: int = 6,
+        lsh_tables: int = 4,
+        ttl_s: Optional[float] = None,
+        seed: int = 0
+    ):
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.lsh_bits = lsh_bits
+        self.lsh_tables = lsh_tables
+        self.ttl_s = ttl_s
+        self._rng = np.random.default_rng(seed)
+        self._version: Optional[Hashable] = None
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        """Drop all entries; arrays are sized on the next store."""
+        self._entries: "OrderedDict[Tuple, int]" = OrderedDict()  # exact key -> slot
+        self._slots: Dict[int, Dict[str, Any]] = {}
+        self._free: List[int] = []
+        self._vectors: Optional[np.ndarray] = None  # unit rows, (max_entries, dim)
+        self._planes: Optional[np.ndarray] = None
+        self._buckets: List[Dict[Tuple, Set[int]]] = [{} for _ in range(self.lsh_tables)]
+
+    def sync(self, version: Hashable):
+        """Invalidate every entry when the indexed corpus has changed."""
+        with self._lock:
+            if version != self._version:
+                if self._entries:
+                    logger.info("Vector store changed; clearing query cache")
+                self._reset()
+                self._version = version
+
+    def get_exact(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        """Return the cached result for exactly this query and parameters."""
+        with self._lock:
+            slot = self._entries.get(key)
+            if slot is None:
+                return None
+            if self._expired(slot):
+                self._evict(slot)
+                return None
+            self._entries.move_to_end(key)
+            return self._slots[slot]["result"]
+
+    def get_similar(self, query_embedding, params: Tuple) -> Optional[Dict[str, Any]]:
+        """
+        Return the result of the most similar cached query with these parameters.
+
+        Args:
+            query_embedding: Embedding of the incoming query
+            params: Retrieval parameters that must match the cached query's
+
+        Returns:
+            Cached result dictionary, or None on a miss
+        """
+        with self._lock:
+            if self._vectors is None:
+                return None
+            vector = _unit(query_embedding)
+            if vector.shape[0] != self._vectors.shape[1]:
+                return None
+
+            candidates: Set[int] = set()
+            for table, signature in zip(self._buckets, self._signatures(vector)):
+                candidates |= table.get((params, signature), set())
+            for slot in [slot for slot in candidates if self._expired(slot)]:
+                self._evict(slot)
+                candidates.discard(slot)
+            if not candidates:
+                return None
+
+            slots = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            similarities = self._vectors[slots] @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                return None
+
+            entry = self._slots[int(slots[best])]
+            self._entries.move_to_end(entry["key"])
+            return entry["result"]
+
+    def store(
+        self,
+        key: Tuple,
+        query_embedding,
+        params: Tuple,
+        result: Dict[str, Any],
+        version: Hashable
+    ):
+        """
+        Cache result under its exact key and query embedding.
+
+        version is the corpus version the result was computed against;
+        results computed before the last sync are discarded.
+        """
+        vector = _unit(query_embedding)
+        with self._lock:
+            if version != self._version:
+                return
+            if self._vectors is None:
+                dim = vector.shape[0]
+                self._vectors = np.zeros((self.max_entries, dim), dtype=np.float32, order="C")
+                self._planes = self._rng.standard_normal(
+                    (self.lsh_tables, self.lsh_bits, dim)
+                ).astype(np.float32)
+                self._free = list(range(self.max_entries - 1, -1, -1))
+            elif vector.shape[0] != self._vectors.shape[1]:
+                return
+
+            if key in self._entries:
+                self._evict(self._entries[key])
+            elif not self._free:
+                self._evict(next(iter(self._entries.values())))
+
+            slot = self._free.pop()
+            signatures = self._signatures(vector)
+            self._vectors[slot] = vector
+            self._slots[slot] = {
+                "key": key,
+                "params": params,
+                "signatures": signatures,
+                "result": result,
+                "stored_at": time.monotonic()
+            }
+            for table, signature in zip(self._buckets, signatures):
+                table.setdefault((params, signature), set()).add(slot)
+            self._entries[key] = slot
+
+    def _expired(self, slot: int) -> bool:
+        """Whether the entry in slot is older than ttl_s."""
+        return (
+            self.ttl_s is not None
+            and time.monotonic() - self._slots[slot]["stored_at"] > self.ttl_s
+        )
+
+    def _evict(self, slot: int):
+        """Remove the entry in slot and return the slot to the free list."""
+        entry = self._slots.pop(slot)
+        del self._entries[entry["key"]]
+        for table, signature in zip(self._buckets, entry["signatures"]):
+            bucket = table[(entry["params"], signature)]
+            bucket.discard(slot)
+            if not bucket:
+                del table[(entry["params"], signature)]
+        self._free.append(slot)
+
+    def _signatures(self, vector: np.ndarray) -> Tuple[bytes, ...]:
+        """LSH bucket of vector in each table, as packed projection sign bits."""
+        signs = (self._planes @ vector) > 0
+        return tuple(np.packbits(row).tobytes() for row in signs)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _unit(embedding) -> np.ndarray:
+    """Return embedding as a unit-length float32 vector; zero vectors stay zero."""
+    vector = np.array(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
@@ -1,28 +1,51 @@
 """
 Retrieval service with confidence scoring and self-correction.
 """
-from typing import List, Dict, Any, Optional
+import asyncio
+from functools import lru_cache
+from typing import (
+    List, Dict, Any, AsyncIterator, Awaitable, Callable, Optional, Tuple, Type, TypeVar
+)
+import numpy as np
 from app.config import settings
-from app.services.embedding_service import EmbeddingService
-from app.services.vector_db_service import VectorDBService
-from app.services.llm_service import LLMService
+from app.services.embedding_service import get_embedding_service
+from app.services.vector_db_service import get_vector_db_service
+from app.services.llm_service import get_llm_service
+from app.services.query_cache import QueryCache
 from app.utils.logger import setup_logger
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential
+)
 
 logger = setup_logger(__name__)
 
+T = TypeVar("T")
+
+NO_RESULTS_ANSWER = "I couldn't find any relevant information to answer your question."
+
 
 class RetrievalService:
     """Service for retrieval with confidence scoring and retries."""
     
     def __init__(self):
-        self.embedding_service = EmbeddingService()
-        self.vector_db_service = VectorDBService()
-        self.llm_service = LLMService()
+        self.embedding_service = get_embedding_service()
+        self.vector_db_service = get_vector_db_service()
+        self.llm_service = get_llm_service()
         self.confidence_threshold = settings.confidence_threshold
         self.max_retries = settings.max_retries
+        self._query_cache: Optional[QueryCache] = None
+        if settings.query_cache_size > 0:
+            self._query_cache = QueryCache(
+                max_entries=settings.query_cache_size,
+                similarity_threshold=settings.query_cache_similarity_threshold,
+                ttl_s=settings.query_cache_ttl_s or None
+            )
     
-    def retrieve_and_answer(
+    async def retrieve_and_answer(
         self,
         query: str,
         top_k: int = None,
@@ -32,6 +55,10 @@ class RetrievalService:
         """
         Retrieve relevant documents and generate answer with confidence scoring.
         
+        Repeated queries, and queries embedding close to a recent one with
+        the same parameters, are answered from the query cache without
+        searching the vector DB or calling the LLM.
+        
         Args:
             query: User query
             top_k: Number of documents to retrieve
@@ -41,104 +68,349 @@ class RetrievalService:
         Returns:
             Dictionary with answer, citations, and metadata
         """
-        threshold = confidence_threshold or self.confidence_threshold
-        top_k = top_k or settings.retrieval_top_k
+        cache = self._query_cache
+        params = (top_k, confidence_threshold, include_citations)
+        key = (query, *params)
+        if cache is not None:
+            version = self.vector_db_service.version
+            cache.sync(version)
+            cached = cache.get_exact(key)
+            if cached is not None:
+                return self._mark_query_cache_hit(cached)
         
-        # Try retrieval with retries
-        for attempt in range(self.max_retries):
-            try:
-                # Generate query embedding
-                query_embedding = self.embedding_service.generate_embedding(query)
-                
-                # Retrieve relevant chunks
-                results = self.vector_db_service.query_vectors(
-                    query_vector=query_embedding,
-                    top_k=top_k
-                )
-                
-                if not results:
-                    logger.warning("No results retrieved from vector database")
-                    return {
-                        "answer": "I couldn't find any relevant information to answer your question.",
-                        "citations": [],
-                        "confidence_score": 0.0,
-                        "retrieval_metadata": {
-                            "retrieval_count": 0,
-                            "attempt": attempt + 1
-                        }
-                    }
-                
-                # Calculate confidence scores
-                confidence_scores = [r["score"] for r in results]
-                max_confidence = max(confidence_scores) if confidence_scores else 0.0
-                avg_confidence = sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0.0
-                
-                # Filter by confidence threshold
-                filtered_results = [
-                    r for r in results if r["score"] >= threshold
-                ]
-                
-                # If no results meet threshold, use top result anyway but with lower confidence
-                if not filtered_results:
-                    logger.warning(f"No results met confidence threshold {threshold}, using top result")
-                    filtered_results = results[:1]
-                    max_confidence = results[0]["score"]
-                
-                # Prepare context chunks
-                context_chunks = [
-                    {
-                        "text": r["metadata"].get("text", ""),
-                        "chunk_id": r["id"],
-                        "document_id": r["metadata"].get("document_id", ""),
-                        "score": r["score"],
-                        "metadata": r["metadata"]
-                    }
-                    for r in filtered_results
-                ]
-                
-                # Generate answer
-                llm_response = self.llm_service.generate_response(
+        # Embedded once; the search and generation stages retry independently
+        query_embedding = await self._embed_query(query)
+        if cache is not None:
+            cached = cache.get_similar(query_embedding, params)
+            if cached is not None:
+                return self._mark_query_cache_hit(cached)
+        
+        retrieval = await self._search(query_embedding, top_k, confidence_threshold)
+        context_chunks = retrieval["context_chunks"]
+        if not context_chunks:
+            result = {
+                "answer": NO_RESULTS_ANSWER,
+                "citations": [],
+                "confidence_score": 0.0,
+                "retrieval_metadata": retrieval["retrieval_metadata"]
+            }
+        else:
+            # Generate answer
+            llm_response = await self._with_retries(
+                lambda attempt: self.llm_service.generate_response(
                     query=query,
                     context_chunks=context_chunks,
-                    include_citations=include_citations
-                )
-                
-                # Build citations
-                citations = self._build_citations(context_chunks) if include_citations else []
-                
-                return {
-                    "answer": llm_response["answer"],
-                    "citations": citations,
-                    "confidence_score": max_confidence,
-                    "retrieval_metadata": {
-                        "retrieval_count": len(filtered_results),
-                        "total_retrieved": len(results),
-                        "avg_confidence": avg_confidence,
-                        "max_confidence": max_confidence,
-                        "threshold_used": threshold,
-                        "attempt": attempt + 1
-                    }
+                    include_citations=include_citations,
+                    query_embedding=query_embedding
+                ),
+                retry_on=self.llm_service.transient_errors
+            )
+            
+            # Build citations
+            citations = self._build_citations(context_chunks) if include_citations else []
+            
+            result = {
+                "answer": llm_response["answer"],
+                "citations": citations,
+                "confidence_score": retrieval["confidence_score"],
+                "retrieval_metadata": {
+                    **retrieval["retrieval_metadata"],
+                    "llm_cache_hit": llm_response.get("cached", False)
                 }
-                
-            except Exception as e:
-                logger.error(f"Retrieval attempt {attempt + 1} failed: {str(e)}")
-                if attempt == self.max_retries - 1:
+            }
+        
+        if cache is not None:
+            cache.store(key, query_embedding, params, result, version)
+        return result
+    
+    async def retrieve_and_answer_batch(
+        self,
+        queries: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Answer several queries with shared embedding and LLM calls.
+        
+        All queries are embedded in one request and searched concurrently;
+        answers for queries with context are generated together by
+        LLMService.generate_response_batch.
+        
+        Args:
+            queries: Dictionaries with the retrieve_and_answer arguments
+                (query, top_k, confidence_threshold, include_citations)
+            
+        Returns:
+            List of answer dictionaries, in the same order as queries
+        """
+        embeddings = await self._with_retries(
+            lambda attempt: self.embedding_service.generate_embeddings(
+                [q["query"] for q in queries]
+            ),
+            retry_on=self.embedding_service.transient_errors
+        )
+        retrievals = await asyncio.gather(*(
+            self._search(embedding, q.get("top_k"), q.get("confidence_threshold"))
+            for q, embedding in zip(queries, embeddings)
+        ))
+        
+        answerable = [i for i, retrieval in enumerate(retrievals) if retrieval["context_chunks"]]
+        llm_items = [
+            {
+                "query": queries[i]["query"],
+                "context_chunks": retrievals[i]["context_chunks"],
+                "include_citations": queries[i].get("include_citations", True),
+                "query_embedding": embeddings[i]
+            }
+            for i in answerable
+        ]
+        llm_responses = []
+        if llm_items:
+            llm_responses = await self._with_retries(
+                lambda attempt: self.llm_service.generate_response_batch(llm_items),
+                retry_on=self.llm_service.transient_errors
+            )
+        llm_by_query = dict(zip(answerable, llm_responses))
+        
+        results = []
+        for i, (q, retrieval) in enumerate(zip(queries, retrievals)):
+            if i not in llm_by_query:
+                results.append({
+                    "answer": NO_RESULTS_ANSWER,
+                    "citations": [],
+                    "confidence_score": 0.0,
+                    "retrieval_metadata": retrieval["retrieval_metadata"]
+                })
+                continue
+            
+            context_chunks = retrieval["context_chunks"]
+            results.append({
+                "answer": llm_by_query[i]["answer"],
+                "citations": (
+                    self._build_citations(context_chunks)
+                    if q.get("include_citations", True) else []
+                ),
+                "confidence_score": retrieval["confidence_score"],
+                "retrieval_metadata": {
+                    **retrieval["retrieval_metadata"],
+                    "llm_cache_hit": llm_by_query[i].get("cached", False)
+                }
+            })
+        
+        return results
+    
+    async def retrieve_context(
+        self,
+        query: str,
+        top_k: int = None,
+        confidence_threshold: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Retrieve and score context chunks without generating an answer.
+        
+        Args:
+            query: User query
+            top_k: Number of documents to retrieve
+            confidence_threshold: Custom confidence threshold
+            
+        Returns:
+            Dictionary with context chunks, query embedding, and metadata
+        """
+        query_embedding = await self._embed_query(query)
+        return await self._search(query_embedding, top_k, confidence_threshold)
+    
+    async def stream_answer(
+        self,
+        query: str,
+        retrieval: Dict[str, Any],
+        include_citations: bool = True
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream an answer over context from retrieve_context.
+        
+        Yields ``token`` events as the answer is generated, followed by a
+        single ``done`` event with citations and confidence metrics.
+        """
+        context_chunks = retrieval["context_chunks"]
+        
+        if not context_chunks:
+            yield {"type": "token", "content": NO_RESULTS_ANSWER}
+        else:
+            async for token in self.llm_service.stream_response(
+                query=query,
+                context_chunks=context_chunks,
+                include_citations=include_citations,
+                query_embedding=retrieval["query_embedding"]
+            ):
+                yield {"type": "token", "content": token}
+        
+        yield {
+            "type": "done",
+            "citations": self._build_citations(context_chunks) if include_citations else [],
+            "confidence_score": retrieval["confidence_score"],
+            "retrieval_metadata": retrieval["retrieval_metadata"]
+        }
+    
+    async def _embed_query(self, query: str) -> np.ndarray:
+        """Embed the query, retrying errors the embedding service marks as transient."""
+        return await self._with_retries(
+            lambda attempt: self.embedding_service.generate_embedding(query),
+            retry_on=self.embedding_service.transient_errors
+        )
+    
+    async def _search(
+        self,
+        query_embedding: np.ndarray,
+        top_k: Optional[int],
+        confidence_threshold: Optional[float]
+    ) -> Dict[str, Any]:
+        """Run _retrieve, retrying only errors the vector DB marks as transient."""
+        return await self._with_retries(
+            lambda attempt: self._retrieve(query_embedding, top_k, confidence_threshold, attempt),
+            retry_if=self.vector_db_service.is_transient
+        )
+    
+    async def _with_retries(
+        self,
+        operation: Callable[[int], Awaitable[T]],
+        retry_on: Tuple[Type[BaseException], ...] = (),
+        retry_if: Optional[Callable[[BaseException], bool]] = None
+    ) -> T:
+        """
+        Run operation(attempt) with jittered exponential backoff between failures.
+        
+        Only the calling service's transient errors are retried: exceptions
+        matching retry_on, or for which retry_if returns True. Configuration
+        errors and bugs are raised on the first failure instead of after
+        max_retries backoff sleeps.
+        """
+        retry = retry_if_exception_type(retry_on)
+        if retry_if is not None:
+            retry = retry | retry_if_exception(retry_if)
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(self.max_retries),
+            # Jitter keeps concurrent failing requests from retrying in lockstep
+            wait=wait_random_exponential(multiplier=1, min=1, max=30),
+            retry=retry,
+            reraise=True
+        )
+        async for attempt in retrying:
+            with attempt:
+                attempt_number = attempt.retry_state.attempt_number
+                try:
+                    return await operation(attempt_number)
+                except Exception as e:
+                    logger.error(f"Retrieval attempt {attempt_number} failed: {str(e)}")
                     raise
-                # Exponential backoff for retries
-                import time
-                time.sleep(2 ** attempt)
+    
+    async def _retrieve(
+        self,
+        query_embedding: np.ndarray,
+        top_k: Optional[int],
+        confidence_threshold: Optional[float],
+        attempt: int
+    ) -> Dict[str, Any]:
+        """Search the vector DB and filter results by confidence."""
+        threshold = confidence_threshold or self.confidence_threshold
+        top_k = top_k or settings.retrieval_top_k
+        
+        # Retrieve relevant chunks
+        results = await self.vector_db_service.aquery_vectors(
+            query_vector=query_embedding,
+            top_k=top_k
+        )
+        
+        if not results:
+            logger.warning("No results retrieved from vector database")
+            return {
+                "context_chunks": [],
+                "confidence_score": 0.0,
+                "query_embedding": query_embedding,
+                "retrieval_metadata": {
+                    "retrieval_count": 0,
+                    "attempt": attempt
+                }
+            }
         
-        raise Exception("Max retries exceeded")
+        # Score statistics, threshold filter and context chunks in one pass
+        context_chunks = []
+        score_sum = 0.0
+        max_confidence = float("-inf")
+        for r in results:
+            score = r["score"]
+            score_sum += score
+            if score > max_confidence:
+                max_confidence = score
+            if score >= threshold:
+                context_chunks.append(self._context_chunk(r))
+        max_confidence = float(max_confidence)
+        avg_confidence = float(score_sum / len(results))
+        
+        # If no results meet threshold, use top result anyway but with lower confidence
+        if not context_chunks:
+            logger.warning(f"No results met confidence threshold {threshold}, using top result")
+            context_chunks = [self._context_chunk(results[0])]
+            max_confidence = results[0]["score"]
+        # Reading order rather than score order: the same chunks produce the
+        # same context text for every query, so prompts share a cacheable
+        # prefix and [Document N] numbering stays stable across queries
+        context_chunks.sort(key=_reading_order)
+        
+        return {
+            "context_chunks": context_chunks,
+            "confidence_score": max_confidence,
+            "query_embedding": query_embedding,
+            "retrieval_metadata": {
+                "retrieval_count": len(context_chunks),
+                "total_retrieved": len(results),
+                "avg_confidence": avg_confidence,
+                "max_confidence": max_confidence,
+                "threshold_used": threshold,
+                "attempt": attempt
+            }
+        }
+    
+    def _context_chunk(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Build a context chunk from a vector DB result."""
+        meta = result["metadata"]
+        return {
+            "text": meta.get("text", ""),
+            "chunk_id": result["id"],
+            "document_id": meta.get("document_id", ""),
+            "score": result["score"],
+            "metadata": meta
+        }
+    
+    def _mark_query_cache_hit(self, cached: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy a cached result, flagging it as served by the query cache."""
+        return {
+            **cached,
+            "retrieval_metadata": {**cached["retrieval_metadata"], "query_cache_hit": True}
+        }
     
     def _build_citations(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Build citation objects from retrieved chunks."""
-        citations = []
-        for chunk in chunks:
-            citations.append({
+        citations = [None] * len(chunks)
+        for i, chunk in enumerate(chunks):
+            text = chunk.get("text", "")
+            citations[i] = {
                 "document_id": chunk.get("document_id", ""),
                 "chunk_id": chunk.get("chunk_id", ""),
-                "text": chunk.get("text", "")[:200] + "..." if len(chunk.get("text", "")) > 200 else chunk.get("text", ""),
+                "text": text[:200] + "..." if len(text) > 200 else text,
                 "confidence_score": chunk.get("score", 0.0),
                 "metadata": chunk.get("metadata", {})
-            })
+            }
         return citations
+
+
+def _reading_order(chunk: Dict[str, Any]) -> Tuple[str, float, str]:
+    """Sort key placing chunks by document, then by position in the document."""
+    return (
+        chunk["document_id"],
+        float(chunk["metadata"].get("chunk_index", -1)),
+        chunk["chunk_id"]
+    )
+
+
+@lru_cache(maxsize=1)
+def get_retrieval_service() -> RetrievalService:
+    """Return the process-wide retrieval service."""
+    return RetrievalService()
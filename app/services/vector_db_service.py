@@ -1,12 +1,171 @@
 """
 Vector database service for storing and retrieving embeddings.
 """
-from typing import List, Dict, Any, Optional
+import asyncio
+import importlib
+import itertools
+import os
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+import numpy as np
 from app.config import settings
+from app.services.hnsw_index import HNSWIndex
+from app.services.ivf_hnsw_index import IVFHNSWIndex
+from app.utils.http import RETRYABLE_STATUS_CODES
 from app.utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+# Network failures worth retrying for any remote store
+NETWORK_ERRORS = (ConnectionError, TimeoutError)
+
+# Backends whose index lives in this process
+IN_PROCESS_BACKENDS = ("hnsw", "ivf_hnsw")
+
+
+def _optional_exception(module: str, name: str) -> Tuple[type, ...]:
+    """Return (exception class,) if module defines it, else ()."""
+    try:
+        return (getattr(importlib.import_module(module), name),)
+    except (ImportError, AttributeError):
+        return ()
+
+
+def _pinecone_transient_errors() -> Tuple[type, ...]:
+    """
+    Pinecone client errors a retry may fix.
+    
+    Only connection failures qualify. PineconeException is also the base of
+    bad-key, missing-index and invalid-request errors, so it is not listed.
+    """
+    return (
+        NETWORK_ERRORS
+        + _optional_exception("pinecone.exceptions", "PineconeProtocolError")
+        + _optional_exception("urllib3.exceptions", "MaxRetryError")
+        + _optional_exception("urllib3.exceptions", "ProtocolError")
+        + _optional_exception("urllib3.exceptions", "NewConnectionError")
+        + _optional_exception("urllib3.exceptions", "TimeoutError")
+    )
+
+
+@lru_cache(maxsize=None)
+def _get_vector_client(db_type: str, index_name: str) -> Any:
+    """
+    Return the process-wide handle for an index.
+    
+    Connecting is done once per (backend, index): Pinecone is initialized
+    once, and the in-process Chroma and HNSW stores are shared rather than
+    recreated empty by each VectorDBService.
+    
+    Returns:
+        Pinecone Index, Chroma collection, HNSWIndex, or IVFHNSWIndex
+    """
+    if db_type == "pinecone":
+        try:
+            import pinecone
+            if not settings.pinecone_api_key:
+                raise ValueError("Pinecone API key not configured")
+            
+            pinecone.init(
+                api_key=settings.pinecone_api_key,
+                environment=settings.pinecone_environment
+            )
+            # Queries and upserts run in worker threads. urllib3 discards
+            # connections beyond the pool size, so an undersized pool means a
+            # fresh TLS handshake for most concurrent requests. Index copies
+            # this configuration when it builds its pool.
+            openapi_config = getattr(getattr(pinecone, "Config", None), "OPENAPI_CONFIG", None)
+            if openapi_config is not None:
+                openapi_config.connection_pool_maxsize = settings.pinecone_connection_pool_size
+            client = pinecone.Index(index_name)
+            logger.info(f"Initialized Pinecone index: {index_name}")
+            return client
+        except Exception as e:
+            logger.error(f"Failed to initialize Pinecone: {str(e)}")
+            raise
+    elif db_type == "chromadb":
+        try:
+            import chromadb
+            collection = chromadb.Client().get_or_create_collection(
+                name=index_name,
+                metadata={"hnsw:space": "cosine"}
+            )
+            logger.info(f"Initialized ChromaDB collection: {index_name}")
+            return collection
+        except Exception as e:
+            logger.error(f"Failed to initialize ChromaDB: {str(e)}")
+            raise
+    elif db_type == "hnsw":
+        try:
+            index = HNSWIndex(
+                max_elements=settings.hnsw_max_elements,
+                m=settings.hnsw_m,
+                ef_construction=settings.hnsw_ef_construction,
+                ef_search=settings.hnsw_ef_search
+            )
+            path = settings.hnsw_index_path
+            if path and os.path.exists(path + ".meta"):
+                try:
+                    index.load(path)
+                    logger.info(f"Loaded HNSW index with {len(index)} vectors from {path}")
+                    return index
+                except Exception as e:
+                    # An unreadable save must not stop the service; documents can be re-ingested
+                    logger.warning(f"Ignoring unreadable HNSW index at {path}: {str(e)}")
+            logger.info(f"Initialized in-process HNSW index: {index_name}")
+            return index
+        except Exception as e:
+            logger.error(f"Failed to initialize HNSW index: {str(e)}")
+            raise
+    elif db_type == "ivf_hnsw":
+        try:
+            index = IVFHNSWIndex(
+                nlist=settings.ivf_nlist,
+                nprobe=settings.ivf_nprobe,
+                train_size=settings.ivf_train_size,
+                m=settings.ivf_hnsw_m,
+                ef_construction=settings.ivf_hnsw_ef_construction,
+                storage=settings.ivf_storage
+            )
+            logger.info(f"Initialized in-process IVF-HNSW index: {index_name}")
+            return index
+        except Exception as e:
+            logger.error(f"Failed to initialize IVF-HNSW index: {str(e)}")
+            raise
+    else:
+        raise ValueError(f"Unsupported vector DB type: {db_type}")
+
+
+def _single_batch(count: int, batch_size: Optional[int]) -> List[Tuple[int, int]]:
+    """Upsert range for in-process indexes, which have no request size limit."""
+    return [(0, count)] if count else []
+
+
+def _sized_batches(count: int, batch_size: Optional[int]) -> List[Tuple[int, int]]:
+    """Split [0, count) into upsert request ranges of at most batch_size."""
+    batch_size = batch_size or settings.vector_upsert_batch_size
+    return [(start, min(start + batch_size, count)) for start in range(0, count, batch_size)]
+
+
+def _as_float32(vectors, metadata=None):
+    """Vectors for in-process indexes, which take float32 arrays."""
+    return np.asarray(vectors, dtype=np.float32), metadata
+
+
+def _as_float32_vector(vector) -> np.ndarray:
+    """Query vector for in-process indexes; the embedding is used without copying."""
+    return np.asarray(vector, dtype=np.float32)
+
+
+def _as_lists(vectors, metadata=None):
+    """Vectors for remote stores, whose clients expect plain lists."""
+    return np.asarray(vectors, dtype=np.float32).tolist(), metadata
+
+
+def _as_list(vector) -> List[float]:
+    """Query vector for remote stores, converted to a list once."""
+    return np.asarray(vector, dtype=np.float32).tolist()
+
 
 class VectorDBService:
     """Service for vector database operations."""
@@ -14,47 +173,83 @@ class VectorDBService:
     def __init__(self):
         self.db_type = settings.vector_db_type
         self.index_name = settings.pinecone_index_name
+        # Caps concurrent upsert requests across all callers
+        self._upsert_slots = asyncio.Semaphore(settings.pinecone_max_concurrency)
+        # Bumped on every write so result caches can tell the corpus changed
+        self._versions = itertools.count(1)
+        self.version = 0
+        # Writes not yet saved to hnsw_index_path, and the task that will save them
+        self._unsaved = False
+        self._save_task: Optional[asyncio.Task] = None
+        # Errors a retry may fix; set per backend
+        self.transient_errors: Tuple[type, ...] = NETWORK_ERRORS
+        # HTTP error types retried only for RETRYABLE_STATUS_CODES
+        self._status_errors: Tuple[type, ...] = ()
         self._client = None
+        # Backend-specific steps, bound once by _initialize_client so no
+        # request branches on db_type
+        self._query: Callable[..., List[Dict[str, Any]]] = None
+        self._upsert: Callable[..., None] = None
+        self._prepare: Callable[..., Tuple[Any, Any]] = None
+        self._prepare_query: Callable[[np.ndarray], Any] = None
+        self._batch_bounds: Callable[[int, Optional[int]], List[Tuple[int, int]]] = None
+        # Where the in-process HNSW index is saved; None for other backends
+        self._index_path: Optional[str] = None
         self._initialize_client()
     
     def _initialize_client(self):
-        """Initialize the vector database client."""
+        """Attach the shared client and bind the backend's query, upsert and formats."""
+        self._client = _get_vector_client(self.db_type, self.index_name)
+        if self.db_type in IN_PROCESS_BACKENDS:
+            # In-process indexes take float32 directly and have no request size limit;
+            # ivf_storage gives them real int8 storage
+            self._prepare = _as_float32
+            self._prepare_query = _as_float32_vector
+            self._batch_bounds = _single_batch
+        else:
+            self._prepare = _as_lists
+            self._prepare_query = _as_list
+            self._batch_bounds = _sized_batches
+        
         if self.db_type == "pinecone":
-            try:
-                import pinecone
-                if not settings.pinecone_api_key:
-                    raise ValueError("Pinecone API key not configured")
-                
-                pinecone.init(
-                    api_key=settings.pinecone_api_key,
-                    environment=settings.pinecone_environment
-                )
-                self._client = pinecone.Index(self.index_name)
-                logger.info(f"Initialized Pinecone index: {self.index_name}")
-            except Exception as e:
-                logger.error(f"Failed to initialize Pinecone: {str(e)}")
-                raise
+            self._query = self._query_pinecone
+            self._upsert = self._upsert_pinecone
+            self.transient_errors = _pinecone_transient_errors()
+            self._status_errors = _optional_exception("pinecone.exceptions", "ApiException")
         elif self.db_type == "chromadb":
-            try:
-                import chromadb
-                self._client = chromadb.Client()
-                self._collection = self._client.get_or_create_collection(
-                    name=self.index_name,
-                    metadata={"hnsw:space": "cosine"}
-                )
-                logger.info(f"Initialized ChromaDB collection: {self.index_name}")
-            except Exception as e:
-                logger.error(f"Failed to initialize ChromaDB: {str(e)}")
-                raise
+            self._query = self._query_chroma
+            self._upsert = self._upsert_chroma
         else:
-            raise ValueError(f"Unsupported vector DB type: {self.db_type}")
+            # In-process indexes already take and return the service's formats
+            self._query = self._client.query
+            self._upsert = self._client.upsert
+            # In-process: a failing query fails the same way on retry
+            self.transient_errors = ()
+            if self.db_type == "hnsw":
+                self._index_path = settings.hnsw_index_path or None
+    
+    def is_transient(self, error: BaseException) -> bool:
+        """
+        Whether a retry may fix error.
+        
+        Connection failures are transient. HTTP errors are transient only
+        for rate limiting and server-side statuses; 4xx responses such as
+        a bad API key or a missing index fail the same way on retry.
+        """
+        if isinstance(error, self.transient_errors):
+            return True
+        return (
+            isinstance(error, self._status_errors)
+            and getattr(error, "status", None) in RETRYABLE_STATUS_CODES
+        )
     
     def upsert_vectors(
         self,
-        vectors: List[List[float]],
+        vectors: Union[List[List[float]], np.ndarray],
         ids: List[str],
-        metadata: List[Dict[str, Any]]
-    ) -> bool:
+        metadata: List[Dict[str, Any]],
+        batch_size: Optional[int] = None
+    ) -> int:
         """
         Upsert vectors into the database.
         
@@ -62,39 +257,173 @@ class VectorDBService:
             vectors: List of embedding vectors
             ids: List of vector IDs
             metadata: List of metadata dictionaries
+            batch_size: Maximum vectors per request
             
         Returns:
-            True if successful
+            Number of vectors upserted
         """
         try:
-            if self.db_type == "pinecone":
-                # Format for Pinecone
-                vectors_to_upsert = [
-                    (id, vector, meta) for id, vector, meta in zip(ids, vectors, metadata)
-                ]
-                self._client.upsert(vectors=vectors_to_upsert)
-            elif self.db_type == "chromadb":
-                self._collection.upsert(
-                    embeddings=vectors,
-                    ids=ids,
-                    metadatas=metadata
-                )
+            vectors, metadata = self._prepare(vectors, metadata)
+            for start, stop in self._batch_bounds(len(vectors), batch_size):
+                self._upsert_batch(vectors[start:stop], ids[start:stop], metadata[start:stop])
+            self._unsaved = True
+            self.persist()
             
             logger.info(f"Upserted {len(vectors)} vectors")
-            return True
+            return len(vectors)
         except Exception as e:
             logger.error(f"Error upserting vectors: {str(e)}")
             raise
     
+    async def upsert_vectors_async(
+        self,
+        vectors: Union[List[List[float]], np.ndarray],
+        ids: List[str],
+        metadata: List[Dict[str, Any]],
+        batch_size: Optional[int] = None
+    ) -> int:
+        """
+        Upsert vectors in batches, sending batches concurrently.
+        
+        Remote stores reject or serialize oversized requests, so vectors
+        are split into batches of batch_size and sent from worker threads.
+        At most pinecone_max_concurrency requests are in flight at once.
+        
+        Args:
+            vectors: List of embedding vectors
+            ids: List of vector IDs
+            metadata: List of metadata dictionaries
+            batch_size: Maximum vectors per request
+            
+        Returns:
+            Number of vectors upserted
+        """
+        try:
+            vectors, metadata = self._prepare(vectors, metadata)
+            
+            async def send(start: int, stop: int):
+                async with self._upsert_slots:
+                    await asyncio.to_thread(
+                        self._upsert_batch,
+                        vectors[start:stop],
+                        ids[start:stop],
+                        metadata[start:stop]
+                    )
+            
+            await asyncio.gather(*(
+                send(start, stop) for start, stop in self._batch_bounds(len(vectors), batch_size)
+            ))
+            self._schedule_save()
+            
+            logger.info(f"Upserted {len(vectors)} vectors")
+            return len(vectors)
+        except Exception as e:
+            logger.error(f"Error upserting vectors: {str(e)}")
+            raise
+    
+    def _schedule_save(self):
+        """Save the HNSW index within hnsw_save_interval_s of a write, once per interval."""
+        if self._index_path is None:
+            return
+        self._unsaved = True
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.get_running_loop().create_task(self._save_later())
+    
+    async def _save_later(self):
+        """Save in a worker thread until no writes arrived during the last save."""
+        while self._unsaved:
+            await asyncio.sleep(settings.hnsw_save_interval_s)
+            await asyncio.to_thread(self.persist)
+    
+    def persist(self):
+        """Save the in-process HNSW index if it has unsaved writes and a path is configured."""
+        if self._index_path is None or not self._unsaved:
+            return
+        # Cleared first so writes made during the save schedule another one
+        self._unsaved = False
+        try:
+            self._client.save(self._index_path)
+        except Exception as e:
+            # The vectors are already searchable; only the on-disk copy is stale
+            logger.error(f"Failed to save HNSW index: {str(e)}")
+    
+    def _upsert_batch(
+        self,
+        vectors: List[List[float]],
+        ids: List[str],
+        metadata: List[Dict[str, Any]]
+    ):
+        """Send one upsert request with already-prepared vectors."""
+        self._upsert(vectors, ids, metadata)
+        # Bumped only once the batch is searchable: a result computed while
+        # the write was in flight is stored under the old version and dropped
+        self.version = next(self._versions)
+    
+    def _upsert_pinecone(
+        self,
+        vectors: List[List[float]],
+        ids: List[str],
+        metadata: List[Dict[str, Any]]
+    ):
+        """Upsert one batch into the Pinecone index."""
+        # Format for Pinecone
+        vectors_to_upsert = [
+            (id, vector, meta) for id, vector, meta in zip(ids, vectors, metadata)
+        ]
+        self._client.upsert(vectors=vectors_to_upsert)
+    
+    def _upsert_chroma(
+        self,
+        vectors: List[List[float]],
+        ids: List[str],
+        metadata: List[Dict[str, Any]]
+    ):
+        """Upsert one batch into the Chroma collection."""
+        self._client.upsert(
+            embeddings=vectors,
+            ids=ids,
+            metadatas=metadata
+        )
+    
+    async def aquery_vectors(
+        self,
+        query_vector: Union[List[float], np.ndarray],
+        top_k: int,
+        filter_dict: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Query similar vectors without blocking the event loop.
+        
+        Every backend's client is synchronous, so queries run in a worker
+        thread. That includes the in-process indexes: their queries wait for
+        running upserts, and waiting from the event loop would stall every
+        request for the length of an ingest. hnswlib and faiss release the
+        GIL while searching, so HNSW queries from several threads run in
+        parallel.
+        
+        Args:
+            query_vector: Query embedding vector
+            top_k: Number of results to return
+            filter_dict: Optional metadata filters
+            
+        Returns:
+            List of results with ids, scores, and metadata
+        """
+        return await asyncio.to_thread(self.query_vectors, query_vector, top_k, filter_dict)
+    
     def query_vectors(
         self,
-        query_vector: List[float],
+        query_vector: Union[List[float], np.ndarray],
         top_k: int,
         filter_dict: Optional[Dict[str, Any]] = None
     ) -> List[Dict[str, Any]]:
         """
         Query similar vectors.
         
+        The float32 array from EmbeddingService.generate_embedding is used
+        without copying. It is converted to a list only for backends whose
+        wire format needs one, and only once.
+        
         Args:
             query_vector: Query embedding vector
             top_k: Number of results to return
@@ -104,35 +433,54 @@ class VectorDBService:
             List of results with ids, scores, and metadata
         """
         try:
-            if self.db_type == "pinecone":
-                results = self._client.query(
-                    vector=query_vector,
-                    top_k=top_k,
-                    include_metadata=True,
-                    filter=filter_dict
-                )
-                return [
-                    {
-                        "id": match.id,
-                        "score": match.score,
-                        "metadata": match.metadata
-                    }
-                    for match in results.matches
-                ]
-            elif self.db_type == "chromadb":
-                results = self._collection.query(
-                    query_embeddings=[query_vector],
-                    n_results=top_k,
-                    where=filter_dict
-                )
-                return [
-                    {
-                        "id": results["ids"][0][i],
-                        "score": 1 - results["distances"][0][i],  # Convert distance to similarity
-                        "metadata": results["metadatas"][0][i]
-                    }
-                    for i in range(len(results["ids"][0]))
-                ]
+            return self._query(self._prepare_query(query_vector), top_k, filter_dict)
         except Exception as e:
             logger.error(f"Error querying vectors: {str(e)}")
             raise
+    
+    def _query_pinecone(
+        self,
+        query_vector: List[float],
+        top_k: int,
+        filter_dict: Optional[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Query the Pinecone index."""
+        results = self._client.query(
+            vector=query_vector,
+            top_k=top_k,
+            include_metadata=True,
+            filter=filter_dict
+        )
+        matches = results.matches
+        return [
+            {"id": match.id, "score": match.score, "metadata": match.metadata}
+            for match in matches
+        ]
+    
+    def _query_chroma(
+        self,
+        query_vector: List[float],
+        top_k: int,
+        filter_dict: Optional[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Query the Chroma collection."""
+        results = self._client.query(
+            query_embeddings=[query_vector],
+            n_results=top_k,
+            where=filter_dict
+        )
+        ids, distances, metadatas = (
+            results["ids"][0], results["distances"][0], results["metadatas"][0]
+        )
+        # Convert distance to similarity for all matches at once
+        scores = (1.0 - np.asarray(distances, dtype=np.float64)).tolist()
+        return [
+            {"id": id, "score": score, "metadata": meta}
+            for id, score, meta in zip(ids, scores, metadatas)
+        ]
+
+
+@lru_cache(maxsize=1)
+def get_vector_db_service() -> VectorDBService:
+    """Return the process-wide vector database service."""
+    return VectorDBService()
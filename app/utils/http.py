@@ -0,0 +1,59 @@
+"""
+Shared HTTP client for provider SDKs.
+"""
+import importlib.util
+from functools import lru_cache
+from app.config import settings
+
+try:
+    # Recent openai/anthropic releases are built on the httpx2 fork and
+    # reject clients from plain httpx
+    import httpx2 as httpx
+except ImportError:
+    import httpx
+
+# Status codes for which a failed request may succeed when retried
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+# Connection failures and timeouts from the shared client
+TRANSPORT_ERRORS = (httpx.TransportError,)
+
+
+class RetryableHTTPStatusError(httpx.HTTPStatusError):
+    """Error response with a status in RETRYABLE_STATUS_CODES."""
+
+
+def raise_for_status(response: httpx.Response):
+    """
+    Raise for an error response, distinguishing retryable statuses.
+
+    Raises:
+        RetryableHTTPStatusError: For rate limiting and server-side failures
+        httpx.HTTPStatusError: For any other 4xx or 5xx response
+    """
+    if response.status_code in RETRYABLE_STATUS_CODES:
+        raise RetryableHTTPStatusError(
+            f"Retryable status {response.status_code} from {response.request.url}",
+            request=response.request,
+            response=response
+        )
+    response.raise_for_status()
+
+
+@lru_cache(maxsize=1)
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Return the process-wide async HTTP client.
+
+    Provider clients share this pool so TCP and TLS setup is paid once per
+    connection rather than per client. HTTP/2 is enabled when the optional
+    h2 package is installed.
+    """
+    return httpx.AsyncClient(
+        http2=importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections
+        ),
+        timeout=settings.http_timeout
+    )
@@ -0,0 +1,24 @@
+"""
+Shared test fixtures.
+"""
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    """Run async tests on asyncio, the loop the app is served on."""
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+async def client():
+    """
+    Async client that calls the app in-process, shared by the whole session.
+
+    The app is imported here rather than at module level so service
+    initialization runs once, and only when an API test needs it.
+    """
+    from app.main import app
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        yield client
@@ -1,16 +1,53 @@
 """
 API endpoint tests.
 """
+import asyncio
+import numpy as np
+import orjson
 import pytest
-from fastapi.testclient import TestClient
-from app.main import app
+from app.config import settings
+from app.services.retrieval_service import NO_RESULTS_ANSWER
 
-client = TestClient(app)
 
+@pytest.fixture
+def stub_ingestion(monkeypatch):
+    """
+    Replace the embedding provider and vector store behind ingestion.
 
-def test_health_check():
+    Returns the list of chunk texts each upsert received.
+    """
+    from app.services.document_service import get_document_service
+    service = get_document_service()
+    upserts = []
+
+    async def generate_embeddings(texts):
+        return np.ones((len(texts), settings.embedding_dimension), dtype=np.float32)
+
+    async def upsert_vectors_async(vectors, ids, metadata, batch_size=None):
+        upserts.append([meta["text"] for meta in metadata])
+        return len(ids)
+
+    monkeypatch.setattr(service.embedding_service, "generate_embeddings", generate_embeddings)
+    monkeypatch.setattr(service.vector_db_service, "upsert_vectors_async", upsert_vectors_async)
+    return upserts
+
+
+async def wait_for_status(client, document_id, timeout=5.0):
+    """Poll a document's status until it leaves queued/processing."""
+    for _ in range(int(timeout / 0.01)):
+        response = await client.get(f"/api/v1/documents/{document_id}")
+        assert response.status_code == 200
+        status = response.json()
+        if status["status"] not in ("queued", "processing"):
+            return status
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Document {document_id} still {status['status']} after {timeout}s")
+
+
+@pytest.mark.anyio
+async def test_health_check(client):
     """Test health check endpoint."""
-    response = client.get("/health")
+    response = await client.get("/health")
     assert response.status_code == 200
     data = response.json()
     assert data["status"] == "healthy"
@@ -24,8 +61,156 @@ def test_query_endpoint():
     pass
 
 
-def test_document_ingest_endpoint():
-    """Test document ingestion endpoint."""
-    # This test would require a sample document file
-    # Skipping for now, but structure is here
-    pass
+@pytest.fixture
+def stub_streaming(monkeypatch):
+    """
+    Stub retrieval and the LLM stream behind /api/v1/query/stream.
+
+    Returns a dict whose "chunks" and "tokens" entries set the retrieved
+    context and the streamed tokens; an exception among the tokens is
+    raised at that point in the stream.
+    """
+    from app.services.retrieval_service import get_retrieval_service
+    service = get_retrieval_service()
+    stub = {"chunks": [], "tokens": []}
+
+    async def retrieve_context(query, top_k=None, confidence_threshold=None):
+        return {
+            "context_chunks": stub["chunks"],
+            "confidence_score": 0.9 if stub["chunks"] else 0.0,
+            "query_embedding": [1.0, 0.0],
+            "retrieval_metadata": {"retrieval_count": len(stub["chunks"])}
+        }
+
+    async def stream_response(query, context_chunks, include_citations=True, query_embedding=None):
+        for token in stub["tokens"]:
+            if isinstance(token, Exception):
+                raise token
+            yield token
+
+    monkeypatch.setattr(service, "retrieve_context", retrieve_context)
+    monkeypatch.setattr(service.llm_service, "stream_response", stream_response)
+    return stub
+
+
+async def stream_events(client, query="What is RAG?"):
+    """POST a streaming query and decode its Server-Sent Events."""
+    response = await client.post("/api/v1/query/stream", json={"query": query})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    frames = response.text.split("\n\n")
+    assert frames[-1] == ""
+    assert all(frame.startswith("data: ") for frame in frames[:-1])
+    return [orjson.loads(frame[len("data: "):]) for frame in frames[:-1]]
+
+
+@pytest.mark.anyio
+async def test_stream_sends_tokens_then_done(client, stub_streaming):
+    """Each token is its own event, followed by one done event with citations."""
+    stub_streaming["chunks"] = [{
+        "text": "RAG grounds answers.", "chunk_id": "d1_0", "document_id": "d1",
+        "score": 0.9, "metadata": {}
+    }]
+    stub_streaming["tokens"] = ["RAG ", "grounds ", "answers."]
+
+    events = await stream_events(client)
+    assert [event["type"] for event in events] == ["token", "token", "token", "done"]
+    assert "".join(event["content"] for event in events[:-1]) == "RAG grounds answers."
+    assert [citation["chunk_id"] for citation in events[-1]["citations"]] == ["d1_0"]
+    assert events[-1]["confidence_score"] == 0.9
+
+
+@pytest.mark.anyio
+async def test_stream_without_context_sends_no_results_answer(client, stub_streaming):
+    """With nothing retrieved the model is not called and the fallback answer is sent."""
+    stub_streaming["tokens"] = [AssertionError("LLM must not be called")]
+
+    events = await stream_events(client)
+    assert events == [
+        {"type": "token", "content": NO_RESULTS_ANSWER},
+        {
+            "type": "done",
+            "citations": [],
+            "confidence_score": 0.0,
+            "retrieval_metadata": {"retrieval_count": 0}
+        }
+    ]
+
+
+@pytest.mark.anyio
+async def test_stream_failure_ends_with_error_event(client, stub_streaming):
+    """An exception mid-stream ends the stream with an error event instead of done."""
+    stub_streaming["chunks"] = [{
+        "text": "text", "chunk_id": "d1_0", "document_id": "d1", "score": 0.9, "metadata": {}
+    }]
+    stub_streaming["tokens"] = ["partial ", RuntimeError("provider dropped the stream")]
+
+    events = await stream_events(client)
+    assert events == [
+        {"type": "token", "content": "partial "},
+        {"type": "error", "detail": "provider dropped the stream"}
+    ]
+
+
+@pytest.mark.anyio
+async def test_query_batch_rejects_oversized_batch(client):
+    """Batches above the configured limit are rejected before retrieval."""
+    queries = [{"query": "What is RAG?"}] * (settings.query_batch_max_size + 1)
+    response = await client.post("/api/v1/query/batch", json=queries)
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_document_ingest_endpoint(client, stub_ingestion):
+    """Uploads are accepted with 202 and reach processed in the background."""
+    text = "Retrieval augmented generation grounds answers in documents. " * 20
+    response = await client.post(
+        "/api/v1/documents/ingest",
+        files={"file": ("notes.txt", text.encode(), "text/plain")}
+    )
+    assert response.status_code == 202
+    accepted = response.json()
+    assert accepted["status"] == "queued"
+
+    status = await wait_for_status(client, accepted["document_id"])
+    assert status["status"] == "processed"
+    assert status["chunks_count"] == len(stub_ingestion[0]) > 0
+
+
+@pytest.mark.anyio
+async def test_unreadable_document_is_marked_failed(client, stub_ingestion):
+    """A document that fails extraction ends as failed and records the error."""
+    response = await client.post(
+        "/api/v1/documents/ingest",
+        files={"file": ("broken.txt", b"\xff\xfe\xfa not utf-8", "text/plain")}
+    )
+    assert response.status_code == 202
+
+    status = await wait_for_status(client, response.json()["document_id"])
+    assert status["status"] == "failed"
+    assert "utf-8" in status["metadata"]["error"]
+    assert stub_ingestion == []
+
+
+@pytest.mark.anyio
+async def test_unsupported_format_is_rejected(client):
+    """Formats without an extractor are refused before a job is queued."""
+    response = await client.post(
+        "/api/v1/documents/ingest",
+        files={"file": ("image.png", b"data", "image/png")}
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_upload_is_refused_when_ingestion_queue_is_full(client, stub_ingestion, monkeypatch):
+    """Uploads beyond ingestion_max_pending get 503 instead of queuing in memory."""
+    from app.services.document_service import get_document_service
+    monkeypatch.setattr(get_document_service(), "max_pending", 0)
+
+    response = await client.post(
+        "/api/v1/documents/ingest",
+        files={"file": ("notes.txt", b"some text", "text/plain")}
+    )
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
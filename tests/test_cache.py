@@ -0,0 +1,27 @@
+"""
+In-process cache tests.
+"""
+from app.utils.cache import LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    """The oldest untouched entry is evicted once maxsize is exceeded."""
+    cache = LRUCache(maxsize=2)
+    cache["a"] = 1
+    cache["b"] = 2
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache["c"] = 3
+
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_lru_cache_get_default_and_pop():
+    """Missing keys return the default and pop removes entries."""
+    cache = LRUCache(maxsize=4)
+    assert cache.get("missing", "default") == "default"
+    cache["key"] = "value"
+    assert cache.pop("key") == "value"
+    assert "key" not in cache
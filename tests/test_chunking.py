@@ -0,0 +1,42 @@
+"""
+Document chunking tests.
+"""
+from app.pipelines.chunking import DocumentChunker
+
+
+SAMPLE_TEXT = (
+    "Retrieval augmented generation grounds answers in documents. "
+    "Each document is split into chunks before embedding.  Chunks overlap!\n"
+    "Overlap keeps context across boundaries? It does. "
+    "Short sentences help the chunker find good boundaries."
+)
+
+
+def test_chunks_are_slices_of_original_text():
+    """Each chunk's text matches its recorded offsets."""
+    chunker = DocumentChunker(chunk_size=80, chunk_overlap=20)
+    chunks = chunker.chunk_text(SAMPLE_TEXT, metadata={"document_id": "doc-1"})
+
+    assert len(chunks) > 1
+    for index, chunk in enumerate(chunks):
+        assert chunk["text"] == SAMPLE_TEXT[chunk["start_index"]:chunk["end_index"]]
+        assert chunk["chunk_id"] == f"doc-1_{index}"
+        assert chunk["metadata"]["chunk_index"] == index
+        assert chunk["metadata"]["document_id"] == "doc-1"
+
+
+def test_chunks_respect_size_and_overlap():
+    """Chunks stay within chunk_size and consecutive chunks overlap."""
+    chunker = DocumentChunker(chunk_size=80, chunk_overlap=20)
+    chunks = chunker.chunk_text(SAMPLE_TEXT)
+
+    assert all(len(chunk["text"]) <= 80 for chunk in chunks)
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current["start_index"] < previous["end_index"]
+        assert current["end_index"] > previous["end_index"]
+    assert chunks[-1]["end_index"] == len(SAMPLE_TEXT.rstrip())
+
+
+def test_empty_text_returns_no_chunks():
+    """Whitespace-only input produces no chunks."""
+    assert DocumentChunker().chunk_text("   \n ") == []
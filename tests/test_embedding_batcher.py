@@ -0,0 +1,158 @@
+"""
+Embedding micro-batcher tests.
+"""
+import asyncio
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.services.embedding_service import EmbeddingService
+from app.utils.http import httpx
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def make_service(monkeypatch):
+    """
+    Build a real OpenAI EmbeddingService with no cache and batching settings
+    overridden; embed_batch, if given, replaces the provider call.
+    """
+    monkeypatch.setattr(settings, "embedding_provider", "openai")
+    monkeypatch.setattr(settings, "openai_api_key", "test-key")
+    monkeypatch.setattr(settings, "embedding_cache_path", "")
+
+    def make(embed_batch=None, max_batch_size=96, max_latency_ms=10.0, max_concurrency=8):
+        monkeypatch.setattr(settings, "embedding_max_batch_size", max_batch_size)
+        monkeypatch.setattr(settings, "embedding_max_latency_ms", max_latency_ms)
+        monkeypatch.setattr(settings, "embedding_max_concurrency", max_concurrency)
+        service = EmbeddingService()
+        if embed_batch is not None:
+            monkeypatch.setattr(service, "_embed_batch", embed_batch)
+        return service
+    return make
+
+
+def response_client(body, urls=None):
+    """HTTP client stub answering every POST with body."""
+    class Client:
+        async def post(self, url, **kwargs):
+            if urls is not None:
+                urls.append(url)
+            return httpx.Response(200, content=body, request=httpx.Request("POST", url))
+    return Client()
+
+
+def recording_embed(calls):
+    async def embed_batch(texts):
+        calls.append(list(texts))
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+    return embed_batch
+
+
+async def test_full_batch_flushes_without_waiting_for_latency(make_service):
+    """A batch reaching max_batch_size is sent before the latency window ends."""
+    calls = []
+    service = make_service(recording_embed(calls), max_batch_size=3, max_latency_ms=10_000)
+
+    embeddings = await asyncio.wait_for(service.generate_embeddings(["a", "bb", "ccc"]), 1)
+    assert calls == [["a", "bb", "ccc"]]
+    assert embeddings[:, 0].tolist() == [1.0, 2.0, 3.0]
+
+
+async def test_concurrent_callers_share_a_batch_until_latency_elapses(make_service):
+    """Texts arriving within max_latency_ms are coalesced; later ones are not."""
+    calls = []
+    service = make_service(recording_embed(calls), max_latency_ms=20)
+
+    first, second = await asyncio.gather(
+        service.generate_embedding("a"), service.generate_embedding("bb")
+    )
+    await service.generate_embedding("ccc")
+    assert calls == [["a", "bb"], ["ccc"]]
+    assert first[0] == 1.0 and second[0] == 2.0
+
+
+async def test_provider_error_reaches_every_caller_in_the_batch(make_service):
+    """A failed provider call fails each future it would have resolved."""
+    async def failing_embed(texts):
+        raise RuntimeError("provider down")
+    service = make_service(failing_embed)
+
+    results = await asyncio.gather(
+        service.generate_embedding("a"), service.generate_embedding("b"), return_exceptions=True
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+async def test_cancelled_callers_are_skipped(make_service):
+    """Texts whose futures are already done are not sent to the provider."""
+    calls = []
+    service = make_service(recording_embed(calls))
+    queue = service._ensure_worker()
+    loop = asyncio.get_running_loop()
+
+    cancelled, waiting = loop.create_future(), loop.create_future()
+    cancelled.cancel()
+    queue.put_nowait(("gone", cancelled))
+    queue.put_nowait(("kept", waiting))
+
+    await asyncio.wait_for(waiting, 1)
+    assert calls == [["kept"]]
+
+
+async def test_batches_run_concurrently(make_service):
+    """A slow batch does not hold back the next one."""
+    started = []
+    release = asyncio.Event()
+
+    async def slow_embed(texts):
+        started.append(texts[0])
+        await release.wait()
+        return np.ones((len(texts), 2), dtype=np.float32)
+    service = make_service(slow_embed, max_batch_size=1, max_concurrency=2)
+
+    pending = asyncio.gather(service.generate_embedding("a"), service.generate_embedding("b"))
+    for _ in range(100):
+        if len(started) == 2:
+            break
+        await asyncio.sleep(0.01)
+    assert sorted(started) == ["a", "b"]
+
+    release.set()
+    await asyncio.wait_for(pending, 1)
+
+
+async def test_short_provider_response_fails_every_caller(make_service):
+    """A response with fewer embeddings than texts fails the batch instead of hanging."""
+    async def short_embed(texts):
+        return np.ones((len(texts) - 1, 2), dtype=np.float32)
+    service = make_service(short_embed)
+
+    results = await asyncio.wait_for(asyncio.gather(
+        service.generate_embedding("a"), service.generate_embedding("b"), return_exceptions=True
+    ), 1)
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+async def test_openai_response_is_matched_by_index(make_service, monkeypatch):
+    """Embeddings are assigned by each item's index, not by response order."""
+    body = b'{"data": [{"index": 1, "embedding": [2.0, 0.0]}, {"index": 0, "embedding": [1.0, 0.0]}]}'
+    service = make_service()
+    monkeypatch.setattr(service, "_client", response_client(body))
+
+    embeddings = await service.generate_embeddings(["first", "second"])
+    assert embeddings[:, 0].tolist() == [1.0, 2.0]
+
+
+async def test_openai_requests_use_the_configured_base_url(make_service, monkeypatch):
+    """Embeddings are requested from openai_base_url, e.g. a compatible gateway."""
+    monkeypatch.setattr(settings, "openai_base_url", "https://gateway.test/v1/")
+    urls = []
+    service = make_service()
+    monkeypatch.setattr(service, "_client", response_client(
+        b'{"data": [{"index": 0, "embedding": [1.0, 0.0]}]}', urls
+    ))
+
+    await service.generate_embeddings(["text"])
+    assert urls == ["https://gateway.test/v1/embeddings"]
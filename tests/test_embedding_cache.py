@@ -0,0 +1,87 @@
+"""
+Embedding cache tests.
+"""
+import sqlite3
+import numpy as np
+from app.services.embedding_cache import EmbeddingCache
+
+
+def test_round_trip_and_misses(tmp_path):
+    """Stored vectors are returned for their keys; unknown keys are absent."""
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+    hit = EmbeddingCache.make_key("model", "hello")
+    miss = EmbeddingCache.make_key("model", "goodbye")
+    cache.set_many({hit: [0.5, -0.25, 1.0]})
+
+    found = cache.get_many([hit, miss, hit])
+    assert list(found) == [hit]
+    np.testing.assert_array_equal(found[hit], [0.5, -0.25, 1.0])
+    cache.close()
+
+
+def test_keys_depend_on_model_and_persist(tmp_path):
+    """The same text under another model misses, and entries survive reopening."""
+    path = str(tmp_path / "data" / "embeddings.sqlite3")
+    cache = EmbeddingCache(path)
+    cache.set_many({EmbeddingCache.make_key("model-a", "text"): [1.0, 2.0]})
+    cache.close()
+
+    reopened = EmbeddingCache(path)
+    assert reopened.get_many([EmbeddingCache.make_key("model-b", "text")]) == {}
+    found = reopened.get_many([EmbeddingCache.make_key("model-a", "text")])
+    np.testing.assert_array_equal(found[EmbeddingCache.make_key("model-a", "text")], [1.0, 2.0])
+    reopened.close()
+
+
+def test_float16_storage_is_close_and_separate(tmp_path):
+    """float16 entries decode to float32 and are not visible to float32 readers."""
+    path = str(tmp_path / "embeddings.sqlite3")
+    key = EmbeddingCache.make_key("model", "text")
+    vector = np.random.default_rng(0).normal(size=64).astype(np.float32)
+
+    half = EmbeddingCache(path, dtype="float16")
+    half.set_many({key: vector})
+    found = half.get_many([key])[key]
+    assert found.dtype == np.float32
+    np.testing.assert_allclose(found, vector, rtol=1e-3, atol=1e-3)
+    half.close()
+
+    full = EmbeddingCache(path)
+    assert full.get_many([key]) == {}
+    full.close()
+
+
+def test_least_recently_used_entries_are_pruned(tmp_path):
+    """Past max_entries, entries not read or written recently are deleted first."""
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(path, max_entries=2)
+    a, b, c = (EmbeddingCache.make_key("model", text) for text in "abc")
+    cache.set_many({a: [1.0]})
+    cache.set_many({b: [2.0]})
+    cache.get_many([a])
+    cache.set_many({c: [3.0]})
+
+    assert set(cache.get_many([a, b, c])) == {a, c}
+    cache.close()
+
+    reopened = EmbeddingCache(path, max_entries=2)
+    reopened.set_many({b: [2.0]})
+    assert len(reopened.get_many([a, b, c])) == 2
+    reopened.close()
+
+
+def test_caches_without_recency_column_are_upgraded(tmp_path):
+    """Databases created before eviction get the accessed_at column on open."""
+    path = str(tmp_path / "embeddings.sqlite3")
+    key = EmbeddingCache.make_key("model", "old")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+    conn.execute("INSERT INTO embeddings VALUES (?, ?)", (key, np.float32([1.0]).tobytes()))
+    conn.commit()
+    conn.close()
+
+    cache = EmbeddingCache(path, max_entries=1)
+    np.testing.assert_array_equal(cache.get_many([key])[key], [1.0])
+    cache.set_many({EmbeddingCache.make_key("model", "new"): [2.0]})
+    assert cache.get_many([key]) == {}
+    cache.close()
@@ -0,0 +1,123 @@
+"""
+In-process HNSW index tests.
+"""
+import os
+import threading
+import numpy as np
+import pytest
+
+pytest.importorskip("hnswlib")
+
+from app.config import settings
+from app.services.hnsw_index import HNSWIndex
+from app.services.vector_db_service import _get_vector_client
+
+
+def test_query_returns_nearest_with_metadata():
+    """The closest vector comes first with its cosine similarity and metadata."""
+    index = HNSWIndex(max_elements=4)
+    index.upsert(
+        np.eye(3, dtype=np.float32),
+        ["a", "b", "c"],
+        [{"document_id": "d1"}, {"document_id": "d1"}, {"document_id": "d2"}]
+    )
+
+    results = index.query([0.9, 0.1, 0.0], top_k=2)
+    assert [r["id"] for r in results] == ["a", "b"]
+    assert results[0]["metadata"] == {"document_id": "d1"}
+    assert results[0]["score"] == pytest.approx(0.9 / np.hypot(0.9, 0.1), abs=1e-5)
+
+
+def test_upsert_replaces_ids_filters_and_grows():
+    """Re-upserted ids are replaced, filters apply, and capacity grows."""
+    index = HNSWIndex(max_elements=1)
+    index.upsert([[1.0, 0.0]], ["a"], [{"document_id": "d1"}])
+    index.upsert([[0.0, 1.0], [1.0, 1.0]], ["a", "b"], [{"document_id": "d1"}, {"document_id": "d2"}])
+
+    assert len(index) == 2
+    assert index.query([0.0, 1.0], top_k=1)[0]["id"] == "a"
+    assert [r["id"] for r in index.query([0.0, 1.0], top_k=5, filter_dict={"document_id": "d2"})] == ["b"]
+    assert index.query([0.0, 1.0], top_k=5, filter_dict={"document_id": "missing"}) == []
+
+
+def test_saved_index_loads_with_ids_and_metadata(tmp_path):
+    """A loaded index answers like the saved one and keeps accepting upserts."""
+    path = str(tmp_path / "data" / "index")
+    saved = HNSWIndex(max_elements=4)
+    saved.upsert(np.eye(3, dtype=np.float32), ["a", "b", "c"], [{"document_id": "d1"}, {}, {}])
+    saved.save(path)
+
+    loaded = HNSWIndex(max_elements=4)
+    loaded.load(path)
+    assert len(loaded) == 3
+    assert loaded.query([1.0, 0.0, 0.0], top_k=1) == saved.query([1.0, 0.0, 0.0], top_k=1)
+
+    loaded.upsert([[0.0, 1.0, 1.0], [-1.0, 0.0, 0.0]], ["d", "a"], [{}, {"document_id": "d2"}])
+    assert len(loaded) == 4
+    assert loaded.query([-1.0, 0.0, 0.0], top_k=1)[0] == {
+        "id": "a", "score": pytest.approx(1.0, abs=1e-5), "metadata": {"document_id": "d2"}
+    }
+
+
+def test_resave_replaces_previous_graph(tmp_path):
+    """Each save names its own graph file and removes the one it supersedes."""
+    path = str(tmp_path / "index")
+    index = HNSWIndex(max_elements=4)
+    index.upsert([[1.0, 0.0]], ["a"], [{}])
+    index.save(path)
+    index.upsert([[0.0, 1.0]], ["b"], [{}])
+    index.save(path)
+
+    graphs = [name for name in os.listdir(tmp_path) if name.endswith(".bin")]
+    assert len(graphs) == 1 and sorted(os.listdir(tmp_path)) == sorted(graphs + ["index.meta"])
+    loaded = HNSWIndex(max_elements=4)
+    loaded.load(path)
+    assert len(loaded) == 2
+
+
+def test_unreadable_save_starts_empty(tmp_path, monkeypatch):
+    """A manifest whose graph is missing is logged and skipped, not raised."""
+    path = str(tmp_path / "index")
+    index = HNSWIndex(max_elements=4)
+    index.upsert([[1.0, 0.0]], ["a"], [{}])
+    index.save(path)
+    for name in os.listdir(tmp_path):
+        if name.endswith(".bin"):
+            os.remove(tmp_path / name)
+
+    monkeypatch.setattr(settings, "hnsw_index_path", path)
+    # Bypass the shared-client cache so the load is attempted here
+    client = _get_vector_client.__wrapped__("hnsw", "test")
+    assert len(client) == 0
+
+
+def test_top_k_above_ef_search_returns_k_results():
+    """Queries asking for more than ef_search results still get all of them."""
+    index = HNSWIndex(max_elements=64, ef_search=4)
+    rng = np.random.default_rng(0)
+    index.upsert(rng.normal(size=(64, 8)), [str(i) for i in range(64)], [{}] * 64)
+
+    assert len(index.query(rng.normal(size=8), top_k=20)) == 20
+
+
+def test_queries_share_the_lock_and_upserts_exclude_them():
+    """A query runs while another holds the read side, but waits for a writer."""
+    index = HNSWIndex(max_elements=4)
+    index.upsert([[1.0, 0.0]], ["a"], [{}])
+
+    def query_in_thread():
+        results = []
+        thread = threading.Thread(target=lambda: results.append(index.query([1.0, 0.0], top_k=1)))
+        thread.start()
+        thread.join(0.5)
+        return thread, results
+
+    with index._lock.read():
+        thread, results = query_in_thread()
+        assert not thread.is_alive() and results[0][0]["id"] == "a"
+
+    with index._lock.write():
+        thread, results = query_in_thread()
+        assert thread.is_alive() and not results
+    thread.join(1)
+    assert results[0][0]["id"] == "a"
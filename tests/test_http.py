@@ -0,0 +1,25 @@
+"""
+HTTP helper tests.
+"""
+import pytest
+
+from app.utils.http import RetryableHTTPStatusError, httpx, raise_for_status
+
+
+def make_response(status_code: int) -> httpx.Response:
+    return httpx.Response(status_code, request=httpx.Request("POST", "https://example.com"))
+
+
+@pytest.mark.parametrize("status_code", [429, 500, 503])
+def test_rate_limits_and_server_errors_are_retryable(status_code):
+    """Statuses a retry may fix raise RetryableHTTPStatusError."""
+    with pytest.raises(RetryableHTTPStatusError):
+        raise_for_status(make_response(status_code))
+
+
+def test_client_errors_are_not_retryable():
+    """Other error statuses raise a plain HTTPStatusError; success raises nothing."""
+    with pytest.raises(httpx.HTTPStatusError) as error:
+        raise_for_status(make_response(401))
+    assert not isinstance(error.value, RetryableHTTPStatusError)
+    raise_for_status(make_response(200))
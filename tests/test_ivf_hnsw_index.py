@@ -0,0 +1,81 @@
+"""
+In-process IVF-HNSW index tests.
+"""
+import threading
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+from app.services.ivf_hnsw_index import IVFHNSWIndex
+
+
+def test_query_before_and_after_training():
+    """Buffered vectors are searched exactly; training keeps every vector findable."""
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((60, 8)).astype(np.float32)
+    ids = [f"v{i}" for i in range(60)]
+    index = IVFHNSWIndex(nlist=2, nprobe=2, train_size=40)
+
+    index.upsert(vectors[:30], ids[:30], [{"document_id": "d1"}] * 30)
+    results = index.query(vectors[7], top_k=2)
+    assert results[0]["id"] == "v7"
+    assert results[0]["score"] == pytest.approx(1.0, abs=1e-5)
+
+    index.upsert(vectors[30:], ids[30:], [{"document_id": "d2"}] * 30)
+    assert len(index) == 60
+    # nprobe covers every cell, so search after training is still exact
+    assert index.query(vectors[7], top_k=1)[0]["id"] == "v7"
+    assert index.query(vectors[45], top_k=1)[0]["id"] == "v45"
+    filtered = index.query(vectors[7], top_k=5, filter_dict={"document_id": "d2"})
+    assert len(filtered) == 5
+    assert all(r["metadata"] == {"document_id": "d2"} for r in filtered)
+
+
+@pytest.mark.parametrize("storage", ["float32", "float16", "int8"])
+def test_upsert_replaces_ids(storage):
+    """Re-upserted ids are replaced rather than duplicated, before and after training."""
+    index = IVFHNSWIndex(nlist=2, nprobe=2, train_size=4, storage=storage)
+    index.upsert([[1.0, 0.0], [0.0, 1.0]], ["a", "b"], [{}, {}])
+    index.upsert([[0.0, 1.0]], ["a"], [{"document_id": "d1"}])
+    assert [r["id"] for r in index.query([1.0, 0.0], top_k=5)] in (["a", "b"], ["b", "a"])
+
+    index.upsert([[1.0, 1.0], [-1.0, 0.0]], ["c", "d"], [{}, {}])
+    index.upsert([[1.0, 0.0]], ["d"], [{}])
+    results = index.query([1.0, 0.0], top_k=5)
+    assert len(index) == 4
+    assert len(results) == 4
+    assert results[0]["id"] == "d"
+
+
+def test_training_does_not_block_queries_or_upserts():
+    """While cells are learned, the flat index keeps serving; its writes reach the IVF index."""
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((40, 8)).astype(np.float32)
+    index = IVFHNSWIndex(nlist=2, nprobe=2, train_size=40)
+    index.upsert(vectors[:39], [f"v{i}" for i in range(39)], [{}] * 39)
+
+    started, release = threading.Event(), threading.Event()
+    build_ivf = index._build_ivf
+
+    def slow_build_ivf(*args):
+        started.set()
+        release.wait(5)
+        return build_ivf(*args)
+    index._build_ivf = slow_build_ivf
+
+    trainer = threading.Thread(target=index.upsert, args=(vectors[39:], ["v39"], [{}]))
+    trainer.start()
+    assert started.wait(5)
+
+    # Served by the flat index while training is blocked
+    assert index.query(vectors[3], top_k=1)[0]["id"] == "v3"
+    index.upsert([vectors[5], -vectors[3]], ["new", "v3"], [{"document_id": "late"}, {}])
+    assert {r["id"] for r in index.query(vectors[5], top_k=2)} == {"v5", "new"}
+
+    release.set()
+    trainer.join(5)
+    assert index._trained and len(index) == 41
+    assert index.query(-vectors[3], top_k=1)[0]["id"] == "v3"
+    assert {r["id"] for r in index.query(vectors[5], top_k=2)} == {"v5", "new"}
+    assert index.query(vectors[5], top_k=5, filter_dict={"document_id": "late"})[0]["id"] == "new"
@@ -0,0 +1,92 @@
+"""
+Batched LLM answer tests.
+"""
+import orjson
+import pytest
+
+from app.config import settings
+from app.services.llm_service import LLMService
+
+pytestmark = pytest.mark.anyio
+
+QUERIES = ["alpha?", "beta?", "gamma?"]
+
+
+@pytest.fixture
+def make_service(monkeypatch):
+    """
+    Build a real LLMService without a response cache whose batched
+    completion returns batch_content and whose single-query completions
+    answer with the query they were asked. Returns the service and the
+    list of completion kinds it was asked for.
+    """
+    pytest.importorskip("openai")
+    monkeypatch.setattr(settings, "llm_provider", "openai")
+    monkeypatch.setattr(settings, "openai_api_key", "test-key")
+    monkeypatch.setattr(settings, "llm_cache_size", 0)
+
+    def make(batch_content):
+        service = LLMService()
+        calls = []
+
+        async def complete(prompt, json_output=False, max_tokens=1024):
+            calls.append("batch" if json_output else "single")
+            if json_output:
+                return batch_content
+            return "single " + next(query for query in QUERIES if query in prompt)
+        monkeypatch.setattr(service, "_complete", complete)
+        return service, calls
+    return make
+
+
+def items():
+    return [
+        {"query": query, "context_chunks": [{"chunk_id": f"c{i}", "text": f"text {i}"}]}
+        for i, query in enumerate(QUERIES)
+    ]
+
+
+def answers(entries):
+    return orjson.dumps({"answers": entries}).decode()
+
+
+async def test_well_formed_answers_are_returned_in_item_order(make_service):
+    """Answers are matched to queries by id, not by their position in the response."""
+    service, calls = make_service(answers([
+        {"id": 3, "answer": "three"}, {"id": 1, "answer": "one"}, {"id": 2, "answer": "two"}
+    ]))
+
+    results = await service.generate_response_batch(items())
+    assert [result["answer"] for result in results] == ["one", "two", "three"]
+    assert all(result["cached"] is False for result in results)
+    assert calls == ["batch"]
+
+
+async def test_missing_or_non_integer_ids_fall_back_to_single_queries(make_service):
+    """Only the entries without a usable id are re-asked individually."""
+    service, calls = make_service(answers([
+        {"id": 1, "answer": "one"}, {"id": "2", "answer": "two"}, {"answer": "three"}
+    ]))
+
+    results = await service.generate_response_batch(items())
+    assert [result["answer"] for result in results] == ["one", "single beta?", "single gamma?"]
+    assert calls == ["batch", "single", "single"]
+
+
+async def test_malformed_json_falls_back_for_every_query(make_service):
+    """A response that is not JSON is discarded and each query asked on its own."""
+    service, calls = make_service("Sure! Here are the answers: ...")
+
+    results = await service.generate_response_batch(items())
+    assert [result["answer"] for result in results] == [f"single {query}" for query in QUERIES]
+    assert calls == ["batch", "single", "single", "single"]
+
+
+async def test_groups_keep_item_order(make_service, monkeypatch):
+    """Queries split across several completions come back in request order."""
+    monkeypatch.setattr(settings, "llm_batch_size", 2)
+    service, _ = make_service(answers([{"id": 1, "answer": "first"}, {"id": 2, "answer": "second"}]))
+
+    results = await service.generate_response_batch(items())
+    # The last group holds one query, which is always answered individually
+    assert [result["answer"] for result in results] == ["first", "second", "single gamma?"]
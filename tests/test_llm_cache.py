@@ -0,0 +1,39 @@
+"""
+Semantic response cache tests.
+"""
+import pytest
+
+pytest.importorskip("hnswlib")
+
+from app.services.llm_cache import SemanticResponseCache
+
+
+RESPONSE = {"answer": "cached answer", "model": "test", "provider": "test"}
+
+
+def test_similar_query_with_same_context_hits():
+    """A near-identical query over the same chunks returns the cached answer."""
+    cache = SemanticResponseCache(max_entries=8, similarity_threshold=0.95)
+    cache.store([1.0, 0.0, 0.0], ["doc_0", "doc_1"], True, RESPONSE)
+
+    assert cache.lookup([0.99, 0.05, 0.0], ["doc_0", "doc_1", "doc_2"], True) == RESPONSE
+
+
+def test_dissimilar_query_or_changed_context_misses():
+    """Different queries, reordered context or citation mode all miss."""
+    cache = SemanticResponseCache(max_entries=8, similarity_threshold=0.95)
+    cache.store([1.0, 0.0, 0.0], ["doc_0", "doc_1"], True, RESPONSE)
+
+    assert cache.lookup([0.0, 1.0, 0.0], ["doc_0", "doc_1"], True) is None
+    assert cache.lookup([1.0, 0.0, 0.0], ["doc_1", "doc_0"], True) is None
+    assert cache.lookup([1.0, 0.0, 0.0], ["doc_0", "doc_1"], False) is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    """Storing past max_entries drops the oldest entry."""
+    cache = SemanticResponseCache(max_entries=1, similarity_threshold=0.95)
+    cache.store([1.0, 0.0, 0.0], ["doc_0"], True, RESPONSE)
+    cache.store([0.0, 1.0, 0.0], ["doc_1"], True, {**RESPONSE, "answer": "newer"})
+
+    assert cache.lookup([1.0, 0.0, 0.0], ["doc_0"], True) is None
+    assert cache.lookup([0.0, 1.0, 0.0], ["doc_1"], True)["answer"] == "newer"
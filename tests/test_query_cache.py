@@ -0,0 +1,76 @@
+"""
+Query answer cache tests.
+"""
+from types import SimpleNamespace
+from app.services import query_cache
+from app.services.query_cache import QueryCache
+
+
+RESULT = {"answer": "cached answer", "retrieval_metadata": {}}
+PARAMS = (5, None, True)
+
+
+def make_cache(**kwargs) -> QueryCache:
+    cache = QueryCache(max_entries=kwargs.pop("max_entries", 8), similarity_threshold=0.95, **kwargs)
+    cache.sync(1)
+    return cache
+
+
+def test_exact_and_semantic_hits():
+    """Identical queries hit exactly; near-identical embeddings hit semantically."""
+    cache = make_cache()
+    cache.store(("what is rag", *PARAMS), [1.0, 0.0, 0.0], PARAMS, RESULT, version=1)
+
+    assert cache.get_exact(("what is rag", *PARAMS)) == RESULT
+    assert cache.get_exact(("what is RAG?", *PARAMS)) is None
+    assert cache.get_similar([0.99, 0.05, 0.0], PARAMS) == RESULT
+    assert cache.get_similar([0.0, 1.0, 0.0], PARAMS) is None
+    assert cache.get_similar([1.0, 0.0, 0.0], (3, None, True)) is None
+
+
+def test_corpus_changes_invalidate_entries():
+    """Syncing to a new version clears entries and rejects stale stores."""
+    cache = make_cache()
+    cache.store(("q", *PARAMS), [1.0, 0.0], PARAMS, RESULT, version=1)
+    cache.sync(2)
+
+    assert cache.get_exact(("q", *PARAMS)) is None
+    cache.store(("q", *PARAMS), [1.0, 0.0], PARAMS, RESULT, version=1)
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    """Storing past capacity evicts the entry used longest ago."""
+    cache = make_cache(max_entries=2)
+    cache.store(("a", *PARAMS), [1.0, 0.0], PARAMS, RESULT, version=1)
+    cache.store(("b", *PARAMS), [0.0, 1.0], PARAMS, RESULT, version=1)
+    cache.get_exact(("a", *PARAMS))
+    cache.store(("c", *PARAMS), [-1.0, 0.0], PARAMS, RESULT, version=1)
+
+    assert cache.get_exact(("b", *PARAMS)) is None
+    assert cache.get_exact(("a", *PARAMS)) == RESULT
+    assert cache.get_similar([-1.0, 0.01], PARAMS) == RESULT
+
+
+def test_similarity_ignores_embedding_magnitude():
+    """Stored and query embeddings are compared by direction only."""
+    cache = make_cache()
+    cache.store(("q", *PARAMS), [4.0, 0.0, 0.0], PARAMS, RESULT, version=1)
+
+    assert cache.get_similar([0.5, 0.02, 0.0], PARAMS) == RESULT
+    assert cache.get_similar([0.0, 0.0, 0.0], PARAMS) is None
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    """Entries older than ttl_s miss in both tiers."""
+    now = [100.0]
+    monkeypatch.setattr(query_cache, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    cache = make_cache(ttl_s=60)
+    cache.store(("q", *PARAMS), [1.0, 0.0], PARAMS, RESULT, version=1)
+
+    now[0] += 30
+    assert cache.get_exact(("q", *PARAMS)) == RESULT
+    now[0] += 31
+    assert cache.get_similar([1.0, 0.0], PARAMS) is None
+    assert cache.get_exact(("q", *PARAMS)) is None
+    assert len(cache) == 0
@@ -0,0 +1,77 @@
+"""
+Transient error classification tests.
+"""
+import pytest
+
+from app.config import settings
+from app.services import retrieval_service, vector_db_service
+from app.services.retrieval_service import RetrievalService
+from app.services.vector_db_service import VectorDBService
+
+
+class FakeApiException(Exception):
+    def __init__(self, status):
+        self.status = status
+
+
+@pytest.fixture
+def make_pinecone_service(monkeypatch):
+    """
+    Build a real Pinecone-configured VectorDBService without connecting;
+    the index client is replaced and everything else runs as in __init__.
+    """
+    monkeypatch.setattr(settings, "vector_db_type", "pinecone")
+    monkeypatch.setattr(vector_db_service, "_get_vector_client", lambda db_type, index_name: object())
+    return VectorDBService
+
+
+def test_only_connection_errors_and_retryable_statuses_are_transient(make_pinecone_service, monkeypatch):
+    """4xx responses and other client errors are not retried."""
+    monkeypatch.setattr(vector_db_service, "_pinecone_transient_errors", lambda: (ConnectionError,))
+    monkeypatch.setattr(
+        vector_db_service, "_optional_exception", lambda module, name: (FakeApiException,)
+    )
+    service = make_pinecone_service()
+
+    assert service.is_transient(ConnectionError())
+    assert service.is_transient(FakeApiException(503))
+    assert service.is_transient(FakeApiException(429))
+    assert not service.is_transient(FakeApiException(401))
+    assert not service.is_transient(FakeApiException(404))
+    assert not service.is_transient(ValueError("dimension mismatch"))
+
+
+def test_pinecone_client_errors_are_classified(make_pinecone_service):
+    """Real Pinecone exceptions: protocol errors and 5xx retry, bad keys and bad input do not."""
+    exceptions = pytest.importorskip("pinecone.exceptions")
+    service = make_pinecone_service()
+
+    assert service.is_transient(exceptions.PineconeProtocolError("connection reset"))
+    assert service.is_transient(exceptions.ServiceException(status=503, reason="unavailable"))
+    assert not service.is_transient(exceptions.UnauthorizedException(status=401, reason="bad key"))
+    assert not service.is_transient(exceptions.NotFoundException(status=404, reason="no index"))
+    assert not service.is_transient(exceptions.ApiValueError("invalid vector"))
+
+
+@pytest.mark.anyio
+async def test_non_transient_errors_are_not_retried(make_pinecone_service, monkeypatch):
+    """An error outside the retry classes is raised after a single attempt."""
+    monkeypatch.setattr(settings, "max_retries", 3)
+    monkeypatch.setattr(settings, "query_cache_size", 0)
+    vector_db = make_pinecone_service()
+    for name, dependency in [
+        ("get_embedding_service", object()),
+        ("get_llm_service", object()),
+        ("get_vector_db_service", vector_db)
+    ]:
+        monkeypatch.setattr(retrieval_service, name, lambda dependency=dependency: dependency)
+    service = RetrievalService()
+    attempts = []
+
+    async def operation(attempt):
+        attempts.append(attempt)
+        raise KeyError("missing config")
+
+    with pytest.raises(KeyError):
+        await service._with_retries(operation, retry_if=vector_db.is_transient)
+    assert attempts == [1]
@@ -0,0 +1,74 @@
+"""
+Retrieval service tests.
+"""
+import asyncio
+import threading
+import numpy as np
+import pytest
+
+pytest.importorskip("hnswlib")
+
+from app.config import settings
+from app.services import retrieval_service
+from app.services.retrieval_service import NO_RESULTS_ANSWER, RetrievalService
+from app.services.vector_db_service import VectorDBService
+
+pytestmark = pytest.mark.anyio
+
+EMBEDDING = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+
+
+class StubEmbeddingService:
+    transient_errors = ()
+
+    async def generate_embedding(self, text):
+        return EMBEDDING
+
+
+class StubLLMService:
+    transient_errors = ()
+
+    async def generate_response(self, query, context_chunks, include_citations=True, query_embedding=None):
+        return {"answer": f"answer from {len(context_chunks)} chunks", "cached": False}
+
+
+@pytest.fixture
+def service(monkeypatch, request):
+    """RetrievalService over a fresh in-process HNSW index and stubbed providers."""
+    monkeypatch.setattr(settings, "vector_db_type", "hnsw")
+    monkeypatch.setattr(settings, "hnsw_index_path", "")
+    # A distinct name gives each test its own index in the shared client cache
+    monkeypatch.setattr(settings, "pinecone_index_name", request.node.name)
+    vector_db = VectorDBService()
+    monkeypatch.setattr(retrieval_service, "get_embedding_service", StubEmbeddingService)
+    monkeypatch.setattr(retrieval_service, "get_llm_service", StubLLMService)
+    monkeypatch.setattr(retrieval_service, "get_vector_db_service", lambda: vector_db)
+    return RetrievalService()
+
+
+async def test_answer_cached_during_a_write_is_not_served_after_it(service):
+    """A query racing an upsert must not pin the pre-write answer in the cache."""
+    vector_db = service.vector_db_service
+    release = threading.Event()
+    upsert = vector_db._upsert
+
+    def slow_upsert(*args):
+        release.wait(5)
+        upsert(*args)
+    vector_db._upsert = slow_upsert
+
+    write = asyncio.ensure_future(vector_db.upsert_vectors_async(
+        [EMBEDDING], ["doc_0"], [{"text": "grounding", "document_id": "doc"}]
+    ))
+    await asyncio.sleep(0.05)
+    during = await service.retrieve_and_answer("what is grounding?")
+    assert during["answer"] == NO_RESULTS_ANSWER
+
+    release.set()
+    await write
+    after = await service.retrieve_and_answer("what is grounding?")
+    assert after["answer"] == "answer from 1 chunks"
+    assert "query_cache_hit" not in after["retrieval_metadata"]
+
+    repeated = await service.retrieve_and_answer("what is grounding?")
+    assert repeated["retrieval_metadata"]["query_cache_hit"] is True